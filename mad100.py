@@ -11,9 +11,11 @@
 
 import re
 import sys
+import random
 from mad100_moves import gen_moves
 import mad100_search
 import mad100_play
+import mad100_bitboard
 
 # The external respresentation of our board is a 100 character string.
 
@@ -102,33 +104,79 @@ PST['K'] = [0] + map( int, pst_ext['K'].split() ) + [0]
 
 PMAT = {'P': 1000, 'K': 3000}   # piece material values
 
+###############################################################################
+# Zobrist hashing
+###############################################################################
+
+# A position is identified by a 64-bit key: the XOR of a random number for each piece
+# on each square (ZOBRIST) and a random number for the side to move (ZOBRIST_SIDE).
+# Because the board is rotated for the other player, we also keep the key of the rotated
+# board. ZOBRIST_ROT[p][i] is the number of the piece p on square i after rotation, so
+# rotation is a swap of the two keys and a move updates both keys with a few XOR's.
+# The seed is fixed: keys must be the same in every run (opening book files).
+
+_zrandom = random.Random(100)
+ZOBRIST = {'.': [0] * 52, '0': [0] * 52}
+for p in 'PKpk':
+   ZOBRIST[p] = [0] + [_zrandom.getrandbits(64) for i in range(50)] + [0]
+ZOBRIST_ROT = dict((p, [ZOBRIST[p.swapcase()][51-i] for i in range(52)]) for p in ZOBRIST)
+ZOBRIST_SIDE = _zrandom.getrandbits(64)
+
+def zobrist_keys(board):
+   # Returns the Zobrist key of board and of the rotated board (white to move)
+   zkey, zrkey = 0, 0
+   for i, p in enumerate(board):
+      zkey ^= ZOBRIST[p][i]
+      zrkey ^= ZOBRIST_ROT[p][i]
+   return zkey, zrkey
+
 ###############################################################################
 # Draughts logic
 ###############################################################################
 
-class Position:
+class Position(object):
     # A state of a draughts100 game
-    # - board: a list of 52 char; first and last index unused ('0') rotation-symmetry
+    # - board: a string of 52 char (immutable); first and last index unused ('0') rotation-symmetry
+    #   A list of 52 char is accepted and joined.
     # - score: the board evaluation
+    # - bb: bitboards of the board (see mad100_bitboard); computed when needed
+    # - zkey, zrkey: Zobrist key of the board and of the rotated board
+    # No __dict__ per position: the attributes are slots.
     # 
+    __slots__ = ('board', 'score', 'bb', 'zkey', 'zrkey')
 
-    def __init__(self, board, score):
-       self.board = board
+    def __init__(self, board, score, bb=None, zkeys=None):
+       self.board = board if isinstance(board, str) else ''.join(board)
        self.score = score
+       self.bb = bb
+       self.zkey, self.zrkey = zobrist_keys(board) if zkeys is None else zkeys
+
+    def __getstate__(self):
+       # Pickle support (multiprocessing) of a class with slots
+       return (self.board, self.score, self.bb, self.zkey, self.zrkey)
+
+    def __setstate__(self, state):
+       self.board, self.score, self.bb, self.zkey, self.zrkey = state
+
+    def bitboards(self):
+       if self.bb is None:
+          self.bb = mad100_bitboard.from_board(self.board)
+       return self.bb
 
     def key(self):
-        pos_key = ''.join(self.board)    # array to string
-        return pos_key
+        return self.zkey     # Zobrist key
 
     def rotate(self):
-        rotBoard = [ x.swapcase() for x in self.board[::-1] ]  # clone!
-        return Position(rotBoard, -self.score)
+        rotBoard = self.board[::-1].swapcase()
+        rotBB = None if self.bb is None else mad100_bitboard.rotate(self.bb)
+        rotKeys = (self.zrkey ^ ZOBRIST_SIDE, self.zkey ^ ZOBRIST_SIDE)   # swap of keys
+        return Position(rotBoard, -self.score, rotBB, rotKeys)
 
     def clone(self):
-        return Position(self.board, self.score)
+        return Position(self.board, self.score, self.bb, (self.zkey, self.zrkey))
 
     def domove(self, move):
-        # Move is named tuple with list of steps and list of takes
+        # Move is named tuple with tuple of steps and tuple of takes
         # Returns new rotated position object after moving.
         # Calculates the score of the returned position.
         # Remember: move is always done with white
@@ -147,9 +195,14 @@ class Position:
            board[j] = 'K'
         else:
            board[j] = p
+        zkey = self.zkey ^ ZOBRIST[p][i] ^ ZOBRIST[board[j]][j]
+        zrkey = self.zrkey ^ ZOBRIST_ROT[p][i] ^ ZOBRIST_ROT[board[j]][j]
 
         # Capture
         for k in move.takes:
+           q = self.board[k]
+           zkey ^= ZOBRIST[q][k]
+           zrkey ^= ZOBRIST_ROT[q][k]
            board[k] = '.'
 
         # We increment the score of the new position depending on the move.
@@ -162,7 +215,11 @@ class Position:
         # The incremental update depending on the move is much faster.
 
         # We rotate the returned position, so it's ready for the next player
-        posnew = Position(board, score).rotate()
+        # The bitboards (if known) are updated with the move instead of computed again.
+        rotBoard = ''.join(board[::-1]).swapcase()
+        rotBB = None if self.bb is None else mad100_bitboard.domove(self.bb, i, j, move.takes)
+        rotKeys = (zrkey ^ ZOBRIST_SIDE, zkey ^ ZOBRIST_SIDE)
+        posnew = Position(rotBoard, -score, rotBB, rotKeys)
 
         return posnew
 
@@ -193,7 +250,7 @@ class Position:
     def eval_pos(self):
        # Computes the board score and returns it
        score1 = sum(PST[p][i] + PMAT[p] for i,p in enumerate(self.board) if i>0 and i<52 and p.isupper())
-       rotBoard = [ c.swapcase() for c in self.board[::-1] ]
+       rotBoard = ''.join(self.board[::-1]).swapcase()
        score2 = sum(PST[p][i] + PMAT[p] for i,p in enumerate(rotBoard) if i>0 and i<52 and p.isupper())
 
        score = score1 - score2
@@ -204,6 +261,93 @@ class Position:
 # *** END class Position ***
 
 
+class SearchPosition(Position):
+    # Mutable position for the search: make/unmake a move in place instead of creating
+    # new positions. We keep the rotated board (and rotated bitboards) next to the board
+    # and update both with the move, so rotation is just a swap of the two.
+    # - rboard: the board of the other player (rotated board)
+    # - rbb: bitboards of the rotated board
+    # The immutable Position stays for the user interface and the opening book.
+    __slots__ = ('rboard', 'rbb')
+
+    def __init__(self, pos):
+       self.board = list(pos.board)
+       self.rboard = [ x.swapcase() for x in pos.board[::-1] ]
+       self.score = pos.score
+       self.zkey, self.zrkey = pos.zkey, pos.zrkey
+       self.bb = mad100_bitboard.from_board(self.board)
+       self.rbb = mad100_bitboard.rotate(self.bb)
+
+    def make(self, move):
+        # Do move in place and rotate, so the position is ready for the next player.
+        # Returns the info needed by unmake to restore the position.
+        # Move None is a null move: only rotate.
+        undo = (self.score, self.zkey, self.zrkey, self.bb, self.rbb)
+        if move is None:
+           self.board, self.rboard = self.rboard, self.board
+           self.bb, self.rbb = self.rbb, self.bb
+           self.zkey, self.zrkey = self.zrkey ^ ZOBRIST_SIDE, self.zkey ^ ZOBRIST_SIDE
+           self.score = -self.score
+           return undo
+
+        board, rboard = self.board, self.rboard
+        i, j = move.steps[0], move.steps[-1]    # first, last (NB. sometimes i==j !)
+        p = board[i]
+        q = 'K' if j <= 5 and p != 'K' else p     # promotion to king
+        score = self.score + self.eval_move(move)
+        zkey = self.zkey ^ ZOBRIST[p][i] ^ ZOBRIST[q][j]
+        zrkey = self.zrkey ^ ZOBRIST_ROT[p][i] ^ ZOBRIST_ROT[q][j]
+
+        taken = []
+        for k in move.takes:
+           c = board[k]
+           taken.append(c)
+           zkey ^= ZOBRIST[c][k]
+           zrkey ^= ZOBRIST_ROT[c][k]
+           board[k] = '.'
+           rboard[51-k] = '.'
+        board[i] = '.'
+        rboard[51-i] = '.'
+        board[j] = q
+        rboard[51-j] = q.swapcase()
+
+        bb = mad100_bitboard.update(self.bb, i, j, move.takes)
+        rbb = mad100_bitboard.update_rotated(self.rbb, i, j, move.takes)
+
+        # Rotate: swap board and rotated board
+        self.board, self.rboard = rboard, board
+        self.bb, self.rbb = rbb, bb
+        self.zkey, self.zrkey = zrkey ^ ZOBRIST_SIDE, zkey ^ ZOBRIST_SIDE
+        self.score = -score
+        return (p, taken) + undo
+
+    def unmake(self, move, undo):
+        # Take back move done by make; undo is the result of make
+        if move is None:
+           self.score, self.zkey, self.zrkey, self.bb, self.rbb = undo
+           self.board, self.rboard = self.rboard, self.board
+           return
+
+        p, taken, self.score, self.zkey, self.zrkey, self.bb, self.rbb = undo
+        board, rboard = self.rboard, self.board    # rotate back
+        i, j = move.steps[0], move.steps[-1]
+        board[j] = '.'
+        rboard[51-j] = '.'
+        board[i] = p
+        rboard[51-i] = p.swapcase()
+        for k, c in zip(move.takes, taken):
+           board[k] = c
+           rboard[51-k] = c.swapcase()
+        self.board, self.rboard = board, rboard
+
+    def position(self):
+        # Returns an immutable Position of the current state
+        return Position(self.board, self.score, self.bb, (self.zkey, self.zrkey))
+
+
+# *** END class SearchPosition ***
+
+
 ###############################################################################
 # User interface
 ###############################################################################
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Batch analysis: search a file of positions and write the results
+# as JSON lines. Non-interactive; run from the commandline:
+#
+#   python mad100_batch.py [options] [infile]
+#
+# Input: one FEN per line (blank lines and lines starting with # are skipped);
+# stdin if no infile. Output: one JSON object per position:
+#   {"id": n, "fen": ..., "move": "32-28", "score": ..., "depth": ...,
+#    "nodes": ..., "pv": ["32-28", ...], "elapsed": ...}
+# id is the number of the position in the input (0 is the first).
+#=====================================================================
+
+from __future__ import print_function
+from __future__ import division
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool, TimeoutError, cpu_count
+try:
+   from Queue import Queue, Empty   # Python 2
+except ImportError:
+   from queue import Queue, Empty
+import mad100_search
+from mad100_moves import clearMoveTable
+from mad100_play import parseFEN, mrender_move
+from mad100_time import TimeControl
+from mad100_tt import TransTable
+
+WHITE, BLACK = 0, 1
+
+# Search methods: search function, name of transposition table, name of node counter
+METHODS = {
+   'mtd': (mad100_search.search, 'tp', 'nodes'),
+   'ab':  (mad100_search.search_ab, 'tpab', 'ynodes'),
+   'f':   (mad100_search.search_pvf, 'tpf', 'xnodes'),
+}
+
+WINDOW = 4            # max positions in progress per process (bounds the memory)
+POOL_WAIT = 1.0       # seconds between checks of the workers when waiting for a result
+
+
+def init_worker():
+   # Initializer of the worker processes: the output of the search is not wanted,
+   # and each worker gets its own (not shared) MTD-bi transposition table.
+   # Ctrl-C is for the main process only: it terminates the workers.
+   signal.signal(signal.SIGINT, signal.SIG_IGN)
+   sys.stdout = open(os.devnull, 'w')
+   mad100_search.tp = TransTable(mad100_search.TABLE_SIZE_MB)
+
+def analyse(task):
+   # Worker: search one position. task is (id, fen, method, maxn, movetime).
+   # Returns the result as dict; an error is returned, not raised.
+   n, fen, method, maxn, movetime = task
+   try:
+      func, tname, nname = METHODS[method]
+      pos = parseFEN(fen)
+      color = BLACK if fen.strip()[0] == 'B' else WHITE
+      mad100_search.clearSearchTables()      # every position gets the same fresh start
+      clearMoveTable()
+      tc = TimeControl(movetime=movetime) if movetime is not None else None
+
+      start = time.time()
+      move, score = func(pos, maxn, tc=tc)
+      elapsed = time.time() - start
+
+      pv = []
+      for entry in mad100_search.gen_pv(pos, getattr(mad100_search, tname)):
+         if entry.move is None: break
+         pv.append(mrender_move(color, entry.move))
+         color = 1 - color
+      color = BLACK if fen.strip()[0] == 'B' else WHITE
+      return {'id': n, 'fen': fen, 'move': mrender_move(color, move) if move is not None else None,
+              'score': score, 'depth': mad100_search.search_depth,
+              'nodes': getattr(mad100_search, nname), 'pv': pv, 'elapsed': round(elapsed, 3)}
+   except Exception as e:
+      return {'id': n, 'fen': fen, 'error': '%s: %s' % (type(e).__name__, e)}
+
+def read_fens(f):
+   # Generator of (id, fen) of the positions of file object f
+   n = 0
+   for line in f:
+      line = line.strip()
+      if line == '' or line.startswith('#'): continue
+      yield n, line
+      n += 1
+
+def read_done(outfile):
+   # Returns set of ids in an existing output file (for resume).
+   # An incomplete last line (crash while writing) is removed from the file. Rows with an
+   # error are removed too: these positions are searched again and their new rows appended.
+   done = set()
+   if not os.path.isfile(outfile): return done
+   with open(outfile, 'rb+') as f:
+      data = f.read()
+      lines = data[:data.rfind(b'\n') + 1].splitlines(True)
+      keep = []
+      for line in lines:
+         try:
+            res = json.loads(line.decode('utf-8'))
+         except ValueError:
+            continue
+         if 'error' not in res and res['id'] not in done:
+            done.add(res['id'])
+            keep.append(line)
+      if len(keep) < len(lines) or sum(len(line) for line in lines) < len(data):
+         f.seek(0)
+         f.write(b''.join(keep))
+         f.truncate()
+   return done
+
+def check_workers(pool, pids):
+   # Raises RuntimeError if a worker of the pool died: its position is lost, so its
+   # result would never come. pids: the process ids of the workers at the start.
+   for p in pool._pool:
+      if p.pid not in pids or p.exitcode is not None:
+         raise RuntimeError('worker process died; run again with the same output file to resume')
+
+def run_batch(fens, out, method='mtd', maxn=mad100_search.MAX_NODES, movetime=None,
+              processes=1, ordered=True, skip=()):
+   # Analyse the positions of iterator fens of (id, fen) and write the results to file object out.
+   # - ordered: write the results in input order, else as soon as they are ready
+   # - skip: ids to skip (done before)
+   # At most WINDOW positions per process are in progress, whatever the size of the input.
+   # The waits for results time out, so Ctrl-C (KeyboardInterrupt) and a dead worker
+   # (RuntimeError) end the run; the pool is terminated and the run can be resumed.
+   # Returns number of analysed positions.
+   pool = Pool(processes, init_worker)
+   pids = set(p.pid for p in pool._pool)
+   window = WINDOW * processes
+   count = 0
+
+   def write(res):
+      out.write(json.dumps(res, sort_keys=True) + '\n')
+      out.flush()              # a crash loses only the positions in progress
+
+   def result(async_res):
+      while True:
+         check_workers(pool, pids)
+         try:
+            return async_res.get(POOL_WAIT)
+         except TimeoutError:
+            pass
+
+   def ready_result():
+      while True:
+         check_workers(pool, pids)
+         try:
+            return ready.get(timeout=POOL_WAIT)
+         except Empty:
+            pass
+
+   try:
+      if ordered:
+         pending = deque()
+         for n, fen in fens:
+            if n in skip: continue
+            pending.append(pool.apply_async(analyse, ((n, fen, method, maxn, movetime),)))
+            count += 1
+            if len(pending) >= window:
+               write(result(pending.popleft()))
+         while pending:
+            write(result(pending.popleft()))
+      else:
+         ready = Queue()          # filled by the result thread of the pool
+         running = 0
+         for n, fen in fens:
+            if n in skip: continue
+            while running >= window:
+               write(ready_result())
+               running -= 1
+            pool.apply_async(analyse, ((n, fen, method, maxn, movetime),), callback=ready.put)
+            running += 1
+            count += 1
+         while running > 0:
+            write(ready_result())
+            running -= 1
+   finally:
+      pool.terminate()
+      pool.join()
+   return count
+
+
+###############################################################################
+def main():
+   parser = argparse.ArgumentParser(description='Batch analysis of positions (FEN per line) to JSON lines')
+   parser.add_argument('infile', nargs='?', help='file with FENs (default: stdin)')
+   parser.add_argument('-o', '--output', help='output file (default: stdout); an existing file is resumed')
+   parser.add_argument('-n', '--nodes', type=int, default=mad100_search.MAX_NODES, help='max nodes per position')
+   parser.add_argument('-t', '--time', type=float, help='seconds per position (instead of nodes)')
+   parser.add_argument('-m', '--method', choices=sorted(METHODS), default='mtd', help='search method')
+   parser.add_argument('-p', '--processes', type=int, default=cpu_count(), help='number of processes')
+   parser.add_argument('-u', '--unordered', action='store_true', help='write results as soon as ready')
+   args = parser.parse_args()
+
+   fin = open(args.infile, 'r') if args.infile else sys.stdin
+   skip = set()
+   if args.output:
+      skip = read_done(args.output)
+      out = open(args.output, 'a')
+   else:
+      out = sys.stdout
+
+   start = time.time()
+   try:
+      count = run_batch(read_fens(fin), out, args.method, args.nodes, args.time,
+                        max(1, args.processes), not args.unordered, skip)
+   except KeyboardInterrupt:
+      print('Interrupted; run again with the same output file to resume', file=sys.stderr)
+      return 130
+   except RuntimeError as e:
+      print('Error: %s' % e, file=sys.stderr)
+      return 1
+   print('Positions analysed: %d  skipped: %d  time: %.3f' % (count, len(skip), time.time() - start),
+         file=sys.stderr)
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Benchmark: a fixed suite of positions searched with a node budget
+#=====================================================================
+
+# Each search method (see mad100_batch.METHODS) searches each position of SUITE
+# with cleared tables and without opening book, so the node counts are the same in
+# every run. The sum of the node counts of all searches is the signature of the
+# bench: a change of the search that should not change the tree (a speed up) must
+# keep the signature; the nodes per second compare machines and interpreters
+# (CPython, PyPy). Endgame tablebases, if opened, are used by the searches.
+#
+# Run from the commandline:
+#   python mad100_bench.py [-n nodes] [-m method ...]
+# or use the command bench of mad100_run.
+
+from __future__ import print_function
+from __future__ import division
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+import mad100_search
+import mad100_play
+from mad100_moves import clearMoveTable
+from mad100_play import parseFEN
+from mad100_batch import METHODS
+
+BENCH_NODES = 5000        # node budget of each search
+
+SUITE = [
+   # initial position and problems of mad100_play
+   mad100_play.FEN_INITIAL,
+   mad100_play.FEN_MAD100_1,
+   mad100_play.FEN_MAD100_2,
+   mad100_play.FEN_MAD100_3,
+   mad100_play.FEN_MAD100_4,
+   mad100_play.FEN_MAD100_5,
+   mad100_play.FEN_MAD100_6,
+   # middlegame
+   'B:W26,28,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50:B2,3,4,5,6,7,8,9,12,13,14,15,16,17,18,19,24',
+   'B:W25,27,31,32,33,35,36,37,38,40,41,42,43,45,47,48,49,50:B1,2,3,6,7,8,9,10,11,12,13,14,15,16,17,19,23,24',
+   'B:W21,25,30,31,32,33,34,35,36,37,38,40,41,42,43,47,48:B2,3,6,8,9,10,12,13,14,15,16,17,18,19,22,24,26',
+   'B:W27,31,32,33,35,39,42,43,45,47,48,49:B2,3,5,7,8,12,13,14,15,16,18,21',
+   # endgame
+   'B:W25,29,30,38,48:B8,14,15,16,27,28',
+   'B:W16,32,33,35:B17,19,20,23,24',
+   'B:WK7,35:B6,K17,19,24,29',
+   'B:W9:B15,16,K43',
+]
+
+
+def bench_position(fen, method, maxn):
+   # Search fen with a fresh start. Returns (nodes, seconds).
+   func, tname, nname = METHODS[method]
+   mad100_search.clearSearchTables()
+   clearMoveTable()
+   pos = parseFEN(fen)
+   start = time.time()
+   func(pos, maxn)
+   return getattr(mad100_search, nname), time.time() - start
+
+def run_bench(maxn=BENCH_NODES, methods=('mtd', 'ab', 'f'), suite=SUITE, verbose=True):
+   # Run the bench. Returns OrderedDict of method -> (nodes, seconds) of the suite.
+   # The output of the searches is suppressed; the opening book is closed for the bench.
+   book = mad100_search.book_bin, OrderedDict(mad100_search.tp_open)
+   mad100_search.book_bin = None
+   mad100_search.tp_open.clear()
+   stdout = sys.stdout
+   res = OrderedDict()
+   try:
+      for method in methods:
+         total, secs = 0, 0.0
+         for n, fen in enumerate(suite):
+            sys.stdout = open(os.devnull, 'w')
+            try:
+               nodes, t = bench_position(fen, method, maxn)
+            finally:
+               sys.stdout.close()
+               sys.stdout = stdout
+            total += nodes
+            secs += t
+            if verbose:
+               print('%-4s position %2d  nodes: %8d  time: %7.3f' % (method, n + 1, nodes, t))
+         res[method] = (total, secs)
+   finally:
+      sys.stdout = stdout
+      mad100_search.book_bin = book[0]
+      mad100_search.tp_open.update(book[1])
+      mad100_search.clearSearchTables()
+      clearMoveTable()
+   return res
+
+def report(res):
+   # Returns the results of run_bench as text
+   lines = ['%-8s %10s %8s %8s' % ('method', 'nodes', 'time', 'nps')]
+   for method, (nodes, secs) in res.items():
+      lines.append('%-8s %10d %8.3f %8d' % (method, nodes, secs, nodes / secs if secs > 0 else 0))
+   nodes = sum(n for n, s in res.values())
+   secs = sum(s for n, s in res.values())
+   lines.append('Nodes searched (signature): %d' % nodes)
+   lines.append('Nodes/second: %d' % (nodes / secs if secs > 0 else 0))
+   return '\n'.join(lines)
+
+
+###############################################################################
+def main():
+   parser = argparse.ArgumentParser(description='Benchmark of the searches on a fixed suite of positions')
+   parser.add_argument('-n', '--nodes', type=int, default=BENCH_NODES, help='max nodes per search')
+   parser.add_argument('-m', '--method', nargs='*', choices=sorted(METHODS), default=['mtd', 'ab', 'f'],
+                       help='search methods')
+   args = parser.parse_args()
+
+   print('Python %s  positions: %d  max nodes: %d' % (sys.version.split()[0], len(SUITE), args.nodes))
+   print(report(run_bench(args.nodes, args.method)))
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
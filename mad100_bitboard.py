@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Bitboard representation for Draughts 100 International Rules
+#=====================================================================
+
+# Remember:
+# - Moves are always calculated for white (uppercase letters) at high numbers!!
+# - A bitboard is a Python int of 50 bits; bit (i-1) represents square i.
+# - A position is a tuple of five bitboards:
+#      (men, kings, omen, okings, empty)
+#   men/kings of the player (uppercase), omen/okings of the opponent (lowercase).
+# - Rotating the board (swap of players) is a reversal of the 50 bits.
+#
+# The functions of this module only use integer operations. They return plain
+# tuples of square numbers; mad100_moves turns them into Move objects.
+
+FULL = (1 << 50) - 1            # all squares of the board
+BIT = [0] + [1 << (i - 1) for i in range(1, 51)] + [0]   # BIT[i] is the bit of square i (rotation-symmetry)
+
+PROMOTION = BIT[1] | BIT[2] | BIT[3] | BIT[4] | BIT[5]   # promotion line of the player
+PROMOTION_ROT = BIT[46] | BIT[47] | BIT[48] | BIT[49] | BIT[50]   # same line on the rotated board
+
+###############################################################################
+# Geometry
+###############################################################################
+
+def _square(r, c):
+   # Square number of row r and column c (both 0..9); 0 if not a playing square
+   if 0 <= r < 10 and 0 <= c < 10 and (r + c) % 2 == 1:
+      return r * 5 + c // 2 + 1
+   return 0
+
+def _coord(i):
+   # Row and column of square i
+   r = (i - 1) // 5
+   c = 2 * ((i - 1) % 5) + (1 if r % 2 == 0 else 0)
+   return r, c
+
+# Directions in the same order as mad100_moves.directions
+NE, SE, SW, NW = 0, 1, 2, 3
+DELTA = [(-1, 1), (1, 1), (1, -1), (-1, -1)]    # (row, column) step of each direction
+FORWARD = (NE, NW)                              # directions of men moves (to low numbers)
+DECREASING = (NE, NW)                           # directions in which square numbers decrease
+
+# NEXT[d][i]: first square from i in direction d (0 if outside the board)
+NEXT = [[0] * 52 for d in range(4)]
+for d in range(4):
+   dr, dc = DELTA[d]
+   for i in range(1, 51):
+      r, c = _coord(i)
+      NEXT[d][i] = _square(r + dr, c + dc)
+
+# RAY[d][i]: list of squares from i in direction d; RAYMASK[d][i]: same as bitboard
+RAY = [[[] for i in range(52)] for d in range(4)]
+RAYMASK = [[0] * 52 for d in range(4)]
+for d in range(4):
+   for i in range(1, 51):
+      j = NEXT[d][i]
+      while j != 0:
+         RAY[d][i].append(j)
+         RAYMASK[d][i] |= BIT[j]
+         j = NEXT[d][j]
+
+def _shift(x, n):
+   # Shift bitboard x over n squares (n may be negative)
+   return x << n if n > 0 else x >> -n
+
+# STEPS[d]: list of (offset, mask); squares in mask have their neighbour in direction d at i + offset.
+# The offset depends on the parity of the row, so each direction has two groups.
+# JUMPS[d]: list of (offset1, offset2, mask); squares in mask have two squares in direction d,
+# the first at i + offset1 and the second at i + offset2.
+STEPS = [[] for d in range(4)]
+JUMPS = [[] for d in range(4)]
+for d in range(4):
+   steps, jumps = {}, {}
+   for i in range(1, 51):
+      j = NEXT[d][i]
+      if j == 0: continue
+      steps[j - i] = steps.get(j - i, 0) | BIT[i]
+      k = NEXT[d][j]
+      if k == 0: continue
+      jumps[(j - i, k - i)] = jumps.get((j - i, k - i), 0) | BIT[i]
+   STEPS[d] = sorted(steps.items())
+   JUMPS[d] = [(off1, off2, mask) for (off1, off2), mask in sorted(jumps.items())]
+
+# REV10[x]: bit reversal of a 10 bit number; used to rotate the board
+REV10 = [int('{0:010b}'.format(x)[::-1], 2) for x in range(1024)]
+
+def _reverse(x):
+   # Reverse the 50 bits of x: square i becomes square 51-i
+   return ( REV10[x & 1023] << 40 | REV10[(x >> 10) & 1023] << 30 | REV10[(x >> 20) & 1023] << 20 |
+            REV10[(x >> 30) & 1023] << 10 | REV10[(x >> 40) & 1023] )
+
+###############################################################################
+# Conversion and update
+###############################################################################
+
+def from_board(board):
+   # Returns bitboards of a board as list of 52 char
+   men = kings = omen = okings = 0
+   for i in range(1, 51):
+      p = board[i]
+      if p == '.': continue
+      if p == 'P': men |= BIT[i]
+      elif p == 'K': kings |= BIT[i]
+      elif p == 'p': omen |= BIT[i]
+      elif p == 'k': okings |= BIT[i]
+   empty = FULL & ~(men | kings | omen | okings)
+   return (men, kings, omen, okings, empty)
+
+def rotate(bb):
+   # Returns the bitboards with the players swapped (board rotated)
+   men, kings, omen, okings, empty = bb
+   return (_reverse(omen), _reverse(okings), _reverse(men), _reverse(kings), _reverse(empty))
+
+def update(bb, i, j, takes, promotion=PROMOTION):
+   # Returns the bitboards after the move from i to j capturing the squares in takes (not rotated).
+   # Same logic as Position.domove; a man reaching the promotion line becomes a king.
+   men, kings, omen, okings, empty = bb
+   if men & BIT[i]:
+      men ^= BIT[i]
+      if BIT[j] & promotion:
+         kings |= BIT[j]
+      else:
+         men |= BIT[j]
+   else:
+      kings = (kings ^ BIT[i]) | BIT[j]
+   for k in takes:
+      omen &= ~BIT[k]
+      okings &= ~BIT[k]
+   empty = FULL & ~(men | kings | omen | okings)
+   return (men, kings, omen, okings, empty)
+
+def update_rotated(rbb, i, j, takes):
+   # Same as update, but for the rotated bitboards: the player owns the lowercase pieces
+   # and square i of the player is square 51-i.
+   omen, okings, men, kings, empty = rbb
+   men, kings, omen, okings, empty = update((men, kings, omen, okings, empty), 51 - i, 51 - j,
+                                            [51 - k for k in takes], PROMOTION_ROT)
+   return (omen, okings, men, kings, empty)
+
+def domove(bb, i, j, takes):
+   # Returns the rotated bitboards after the move from i to j capturing the squares in takes.
+   return rotate(update(bb, i, j, takes))
+
+def _squares(x):
+   # List of square numbers of the bits of x (ascending)
+   res = []
+   while x:
+      low = x & -x
+      res.append(low.bit_length())    # bit (i-1) has bit length i
+      x ^= low
+   return res
+
+###############################################################################
+# Move generation
+###############################################################################
+
+def men_moves(bb):
+   # List of (from, to) of all non-capture moves of the men
+   men, kings, omen, okings, empty = bb
+   moves = []
+   for d in FORWARD:
+      for off, mask in STEPS[d]:
+         to = _shift(men & mask, off) & empty
+         for j in _squares(to):
+            moves.append((j - off, j))
+   return moves
+
+def men_captures(bb):
+   # List of (from, to, take) of all one-take captures of the men
+   men, kings, omen, okings, empty = bb
+   opp = omen | okings
+   captures = []
+   for d in range(4):
+      for off1, off2, mask in JUMPS[d]:
+         src = men & mask & _shift(opp, -off1) & _shift(empty, -off2)
+         for i in _squares(src):
+            captures.append((i, i + off2, i + off1))
+   return captures
+
+def _blocker(d, occ):
+   # First square of the occupied squares occ on a ray in direction d
+   if d in DECREASING:
+      return occ.bit_length()           # highest bit is nearest
+   return (occ & -occ).bit_length()     # lowest bit is nearest
+
+def king_moves(bb):
+   # List of (from, to) of all non-capture moves of the kings
+   men, kings, omen, okings, empty = bb
+   moves = []
+   for i in _squares(kings):
+      for d in range(4):
+         ray = RAYMASK[d][i]
+         occ = ray & ~empty
+         if occ:
+            b = _blocker(d, occ)
+            ray &= ~(RAYMASK[d][b] | BIT[b])   # squares before the blocker
+         for j in _squares(ray):
+            moves.append((i, j))
+   return moves
+
+def king_captures(bb):
+   # List of (from, to, take) of all one-take captures of the kings
+   men, kings, omen, okings, empty = bb
+   opp = omen | okings
+   captures = []
+   for i in _squares(kings):
+      for d in range(4):
+         occ = RAYMASK[d][i] & ~empty
+         if not occ: continue
+         b = _blocker(d, occ)
+         if not opp & BIT[b]: continue        # own piece on this diagonal
+         land = RAYMASK[d][b]
+         occ = land & ~empty
+         if occ:
+            c = _blocker(d, occ)
+            land &= ~(RAYMASK[d][c] | BIT[c])  # empty squares behind the taken piece
+         for j in _squares(land):
+            captures.append((i, j, b))
+   return captures
+
+def has_capture(bb):
+   # Returns True if the player has a capture else False.
+   men, kings, omen, okings, empty = bb
+   opp = omen | okings
+   for d in range(4):
+      for off1, off2, mask in JUMPS[d]:
+         if men & mask & _shift(opp, -off1) & _shift(empty, -off2):
+            return True
+   if kings:
+      for i in _squares(kings):
+         for d in range(4):
+            occ = RAYMASK[d][i] & ~empty
+            if not occ: continue
+            b = _blocker(d, occ)
+            if opp & BIT[b] and empty & BIT[NEXT[d][b]]:
+               return True
+   return False
+
+def is_move(bb, i, j):
+   # Returns True if the move from i to j is a legal non-capture move (captures not checked)
+   men, kings, omen, okings, empty = bb
+   if not empty & BIT[j]: return False
+   if men & BIT[i]:
+      return j == NEXT[NE][i] or j == NEXT[NW][i]
+   if kings & BIT[i]:
+      for d in range(4):
+         if RAYMASK[d][i] & BIT[j]:
+            between = RAYMASK[d][i] & ~RAYMASK[d][j] & ~BIT[j]
+            return between & empty == between
+   return False
+
+def captures(bb):
+   # List of (from, to, take) of all one-take captures
+   return men_captures(bb) + king_captures(bb)
+
+def moves(bb):
+   # List of (from, to) of all non-capture moves
+   return men_moves(bb) + king_moves(bb)
+
+
+# *********************************************************************************
+def main():
+   print('nothing to do')
+   return 0
+
+if __name__ == '__main__':
+    main()
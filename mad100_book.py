@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Binary opening book
+#=====================================================================
+
+# The text book (one opening per line, see data/mad100_openbook) is compiled to a
+# binary file of records sorted by the Zobrist key of the position:
+#   key     8 bytes   Zobrist key of the position before the move (pos.key())
+#   move    2 bytes   move code (see mad100_moves.move_code)
+#   weight  4 bytes   number of openings that reach the position after the move
+# A record with move code 0 is a target: key is a position reached by a book move and
+# weight the number of openings that reach it.
+# The records follow a header of 20 bytes: magic, version, number of records and the
+# least number of pieces of a target.
+#
+# The engine opens the file with mmap and finds the moves of a position with a
+# binary search on the key: there is no loading time and a probe costs a few
+# reads, also for very large books. A position off the book lines has no moves in the
+# book, but a move that transposes to a target is a book move (like the text book):
+# then each legal move costs a probe. A move never adds pieces, so this is only done
+# for positions with at least the least number of pieces of a target (the book range).
+#
+# Run from the commandline to compile a text book:
+#   python mad100_book.py [<text book> [<binary book>]]
+
+from __future__ import print_function
+import mmap
+import re
+import struct
+import sys
+import mad100
+from mad100_moves import gen_moves, move_code, code_move
+from mad100_play import mparse_move
+
+BOOK_FILE = 'data/mad100_openbook'
+BINARY_BOOK_FILE = 'data/mad100_openbook.bin'
+
+MAGIC = b'MAD100BK'
+VERSION = 3
+HEADER = struct.Struct('<8sIII')       # magic, version, number of records, least pieces of a target
+RECORD = struct.Struct('<QHI')         # key, move code, weight
+
+WHITE, BLACK = 0, 1
+
+
+###############################################################################
+# Compiler
+###############################################################################
+
+def pieces(pos):
+   # Returns number of pieces of pos
+   return len(pos.board) - pos.board.count('.') - 2
+
+def read_text(f):
+   # Returns dict of (key, move code) -> weight of all moves of the openings of text book f,
+   # and (key, 0) -> weight of the targets; and the least number of pieces of a target.
+   # Like the text book of mad100_search, the weight of a move is the number of openings
+   # that reach the position after the move; so a move that transposes to a position of
+   # another opening is a book move too.
+   freq = {}          # key of position after a move -> number of openings
+   positions = {}     # key -> position before a move
+   min_pieces = 0
+   for line in open(f, 'r'):
+      line = line.strip()
+      if line == '': continue
+      pos = mad100.newPos(mad100.initial_ext)  # starting position
+      color = WHITE
+      for smove in line.split():
+         smove = re.sub(r'[123456789]?[123456789]\.', '' , smove)  # remove move number '99.'
+         move = mad100.match_move(pos, mparse_move(color, smove))
+         if move is None or move not in gen_moves(pos):
+            print('Illegal move in opening book', smove, line)
+            break
+         positions[pos.key()] = pos
+         pos = pos.domove(move)
+         freq[pos.key()] = freq.get(pos.key(), 0) + 1
+         min_pieces = pieces(pos) if min_pieces == 0 else min(min_pieces, pieces(pos))
+         color = 1 - color      # alternating 0 and 1 (WHITE and BLACK)
+
+   weights = {}
+   for key, pos in positions.items():
+      for move in gen_moves(pos):
+         n = freq.get(pos.domove(move).key())
+         code = move_code(pos, move)
+         if n is not None and code != 0:
+            weights[(key, code)] = n
+   for key, n in freq.items():
+      weights[(key, 0)] = n        # target
+   return weights, min_pieces
+
+def write_book(weights, f, min_pieces=0):
+   # Write binary book f of dict of (key, move code) -> weight (move code 0: target);
+   # min_pieces: the least number of pieces of a target. Returns number of records.
+   out = open(f, 'wb')
+   out.write(HEADER.pack(MAGIC, VERSION, len(weights), min_pieces))
+   for (key, code) in sorted(weights):
+      out.write(RECORD.pack(key, code, min(weights[(key, code)], 0xFFFFFFFF)))
+   out.close()
+   return len(weights)
+
+def compile_book(textfile=BOOK_FILE, binfile=BINARY_BOOK_FILE):
+   # Compile text book to binary book. Returns number of records.
+   weights, min_pieces = read_text(textfile)
+   return write_book(weights, binfile, min_pieces)
+
+
+###############################################################################
+# Reader
+###############################################################################
+
+class BinaryBook:
+   # Binary book opened with mmap (read only)
+
+   def __init__(self, f=BINARY_BOOK_FILE):
+      self.file = open(f, 'rb')
+      self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+      magic, version, self.count, self.min_pieces = HEADER.unpack_from(self.buf, 0)
+      if magic != MAGIC or version != VERSION:
+         self.close()
+         raise ValueError('not a binary opening book: ' + f)
+
+   def key_at(self, i):
+      # Key of record i
+      return struct.unpack_from('<Q', self.buf, HEADER.size + i * RECORD.size)[0]
+
+   def probe(self, key):
+      # Returns list of (move code, weight) of position key; move code 0 is a target
+      lo, hi = 0, self.count
+      while lo < hi:                       # first record with key >= key
+         mid = (lo + hi) // 2
+         if self.key_at(mid) < key:
+            lo = mid + 1
+         else:
+            hi = mid
+      res = []
+      while lo < self.count:
+         k, code, weight = RECORD.unpack_from(self.buf, HEADER.size + lo * RECORD.size)
+         if k != key: break
+         res.append((code, weight))
+         lo += 1
+      return res
+
+   def moves(self, pos):
+      # Returns list of (move, weight) of the book moves of pos
+      res = []
+      for code, weight in self.probe(pos.key()):
+         move = code_move(pos, code)
+         if move is not None:        # code 0 (target) or key collision: move code not legal
+            res.append((move, weight))
+      if res or pieces(pos) < self.min_pieces: return res
+      for move in gen_moves(pos):     # off the book lines: the moves that transpose to a target
+         for code, weight in self.probe(pos.domove(move).key()):
+            if code == 0:
+               res.append((move, weight))
+      return res
+
+   def close(self):
+      self.buf.close()
+      self.file.close()
+
+# end class BinaryBook
+
+
+###############################################################################
+def main():
+   textfile = sys.argv[1] if len(sys.argv) > 1 else BOOK_FILE
+   binfile = sys.argv[2] if len(sys.argv) > 2 else BINARY_BOOK_FILE
+   count = compile_book(textfile, binfile)
+   print('Binary opening book written: %s  records: %d' % (binfile, count))
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Offline opening book builder
+#=====================================================================
+
+# Builds a weighted binary opening book (see mad100_book) in three steps:
+# 1. expand the book tree of the openings of a text book (one opening per line,
+#    like data/mad100_openbook) or of the games of PDN files (*.pdn), up to a
+#    number of plies
+# 2. evaluate every leaf of the tree with search() at a fixed node budget; the leaves
+#    are divided over a process pool
+# 3. back up the scores through the tree (negamax) and give the moves within MARGIN of
+#    the best move of a position a weight; the best move gets the highest weight
+#
+# The scores of the leaves are appended to a checkpoint file, so an interrupted
+# build resumes with the leaves not yet evaluated. Each score is stored with the node
+# budget and the search settings (see search_settings); a resumed build with other
+# settings evaluates those leaves again, so a book never mixes scores of different searches.
+#
+# Run from the commandline:
+#   python mad100_bookbuild.py [options] [<text book or pdn file> ...]
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+import mad100
+import mad100_search
+import mad100_book
+from mad100_moves import gen_moves, move_code, clearMoveTable
+from mad100_play import mparse_move
+from mad100_batch import init_worker
+
+BUILD_FILE = 'data/mad100_openbook_built.bin'
+BUILD_NODES = 20000       # node budget of the search of a leaf
+BUILD_PLIES = 10          # max depth of the book tree
+MARGIN = 30               # moves with a score within MARGIN of the best are book moves
+
+WHITE, BLACK = 0, 1
+RESULTS = set(['2-0', '0-2', '1-1', '0-0', '1-0', '0-1', '*'])    # game results of PDN
+
+
+###############################################################################
+# Book tree
+###############################################################################
+
+def read_games(f):
+   # Generator of lists of moves (like '32-28' or '26x37') of the openings of a text book,
+   # or of the games of a PDN file (extension .pdn; games with a setup position are skipped).
+   if not f.lower().endswith('.pdn'):
+      for line in open(f, 'r'):
+         if line.strip() != '':
+            yield [re.sub(r'[123456789]?[123456789]\.', '', s) for s in line.split()]
+      return
+
+   text = open(f, 'r').read()
+   text = re.sub(r'\{[^}]*\}', ' ', text)           # comments
+   for game in re.split(r'\n\s*\n(?=\s*\[)', text):
+      if re.search(r'\[\s*FEN\s', game): continue
+      game = re.sub(r'\[[^\]]*\]', ' ', game)       # tags
+      moves = []
+      for s in game.split():
+         s = re.sub(r'^[0-9]+\.+', '', s)           # move number
+         if s in RESULTS: break
+         if re.match(r'^[0-5]?[0-9]([-x][0-5]?[0-9])+$', s):
+            moves.append(s)
+      if moves:
+         yield moves
+
+def expand_tree(files, plies=BUILD_PLIES):
+   # Returns the book tree: dict of key -> (position, dict of move code -> key of child)
+   tree = {}
+   for f in files:
+      for moves in read_games(f):
+         pos = mad100.newPos(mad100.initial_ext)  # starting position
+         color = WHITE
+         tree.setdefault(pos.key(), (pos, {}))
+         for smove in moves[:plies]:
+            move = mad100.match_move(pos, mparse_move(color, smove))
+            if move is None or move not in gen_moves(pos):
+               print('Illegal move', smove, 'in', f)
+               break
+            code = move_code(pos, move)
+            if code == 0: break
+            posnew = pos.domove(move)
+            tree[pos.key()][1][code] = posnew.key()
+            tree.setdefault(posnew.key(), (posnew, {}))
+            pos = posnew
+            color = 1 - color
+   return tree
+
+
+###############################################################################
+# Evaluation of the leaves
+###############################################################################
+
+def evaluate(task):
+   # Worker: search a leaf. Returns (key, score); score from the view of the side to move.
+   key, pos, maxn = task
+   mad100_search.clearSearchTables()      # every leaf gets the same fresh start
+   clearMoveTable()
+   move, score = mad100_search.search(pos, maxn)
+   return key, score
+
+def search_settings(maxn):
+   # Returns dict of the node budget and the settings of the search of the leaves
+   return {'nodes': maxn, 'null': mad100_search.nullswitch, 'null_r': mad100_search.NULL_R,
+           'lmr': mad100_search.lmrswitch['mtd'], 'futility': mad100_search.futilityswitch['mtd']}
+
+def read_checkpoint(f, settings):
+   # Returns dict of key -> score of the evaluated leaves in checkpoint file f.
+   # Scores of a search with other settings (or without settings: older files) are skipped.
+   scores = {}
+   if not os.path.isfile(f): return scores
+   other = set()
+   for line in open(f, 'r'):
+      try:
+         res = json.loads(line)
+      except ValueError:
+         continue                  # incomplete last line
+      if res.get('settings') == settings:
+         scores[res['key']] = res['score']
+      else:
+         other.add(res['key'])
+   other -= set(scores)
+   if other:
+      print('Checkpoint: %d leaves evaluated with other settings are evaluated again' % len(other))
+   return scores
+
+def evaluate_leaves(tree, checkpoint, maxn=BUILD_NODES, processes=1):
+   # Returns dict of key -> score of all leaves; new scores are appended to the checkpoint file
+   settings = search_settings(maxn)
+   scores = read_checkpoint(checkpoint, settings)
+   leaves = [key for key, (pos, children) in tree.items() if not children]
+   todo = [(key, tree[key][0], maxn) for key in leaves if key not in scores]
+   print('Leaves: %d  evaluated before: %d  to do: %d' % (len(leaves), len(leaves) - len(todo), len(todo)))
+   if not todo: return scores
+
+   out = open(checkpoint, 'a')
+   pool = Pool(processes, init_worker)
+   start = time.time()
+   try:
+      for n, (key, score) in enumerate(pool.imap_unordered(evaluate, todo), 1):
+         scores[key] = score
+         out.write(json.dumps({'key': key, 'score': score, 'settings': settings}) + '\n')
+         out.flush()
+         if n % 100 == 0 or n == len(todo):
+            print('evaluated %d of %d  time: %.1f' % (n, len(todo), time.time() - start))
+   finally:
+      pool.terminate()
+      pool.join()
+      out.close()
+   return scores
+
+
+###############################################################################
+# Backup and weights
+###############################################################################
+
+def backup(tree, scores):
+   # Returns dict of key -> negamax score of all nodes of the tree
+   values = {}
+   def value(key):
+      if key not in values:
+         pos, children = tree[key]
+         if not children:
+            values[key] = scores[key]
+         else:
+            values[key] = max(-value(child) for child in children.values())
+      return values[key]
+   for key in tree:
+      value(key)
+   return values
+
+def book_weights(tree, values, margin=MARGIN):
+   # Returns dict of (key, move code) -> weight of the book moves, and (key, 0) -> weight
+   # of the positions reached by a book move (targets of transpositions, see mad100_book)
+   weights = {}
+   for key, (pos, children) in tree.items():
+      if not children: continue
+      scores = dict((code, -values[child]) for code, child in children.items())
+      best = max(scores.values())
+      for code, score in scores.items():
+         if score >= best - margin:
+            w = 1 + margin - (best - score)
+            weights[(key, code)] = w
+            weights[(children[code], 0)] = max(w, weights.get((children[code], 0), 0))
+   return weights
+
+def build_book(files, outfile=BUILD_FILE, maxn=BUILD_NODES, plies=BUILD_PLIES,
+               margin=MARGIN, processes=1):
+   # Build a weighted binary book of the openings of files. Returns number of records.
+   tree = expand_tree(files, plies)
+   print('Book tree: %d positions' % len(tree))
+   scores = evaluate_leaves(tree, outfile + '.ckpt', maxn, processes)
+   values = backup(tree, scores)
+   weights = book_weights(tree, values, margin)
+   targets = [mad100_book.pieces(tree[key][0]) for key, code in weights if code == 0]
+   return mad100_book.write_book(weights, outfile, min(targets) if targets else 0)
+
+
+###############################################################################
+def main():
+   parser = argparse.ArgumentParser(description='Build a weighted binary opening book')
+   parser.add_argument('files', nargs='*', default=[mad100_book.BOOK_FILE],
+                       help='text books or PDN files (default: %s)' % mad100_book.BOOK_FILE)
+   parser.add_argument('-o', '--output', default=BUILD_FILE, help='binary book (checkpoint: <output>.ckpt)')
+   parser.add_argument('-n', '--nodes', type=int, default=BUILD_NODES, help='max nodes per leaf')
+   parser.add_argument('-d', '--plies', type=int, default=BUILD_PLIES, help='max depth of the book')
+   parser.add_argument('-m', '--margin', type=int, default=MARGIN, help='score margin of book moves')
+   parser.add_argument('-p', '--processes', type=int, default=cpu_count(), help='number of processes')
+   args = parser.parse_args()
+
+   start = time.time()
+   count = build_book(args.files, args.output, args.nodes, args.plies, args.margin, max(1, args.processes))
+   print('Binary opening book written: %s  records: %d  time: %.1f' % (args.output, count, time.time() - start))
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
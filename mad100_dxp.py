@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# DXP protocol server (engine matches over TCP)
+#=====================================================================
+
+# DXP (Draughts eXchange Protocol, version 1) messages end with a null character:
+#   GAMEREQ  R vv name(32) color(W|Z) time(3) moves(3) A | B tomove(W|Z) board(50: e w z W Z)
+#   GAMEACC  A name(32) code(1)                  code 0: accepted
+#   MOVE     M time(4) from(2) to(2) n(2) taken(2 each)
+#   GAMEEND  E reason(1) stop(1)                 reason 0: unknown, 1: I lose, 2: draw, 3: I win
+#   BACKREQ  B move(3) color(1)  -> BACKACC  K code(1)     (take back: not supported)
+#   CHAT     C text
+# The engine is the follower: it listens for connections and plays the games the
+# initiator (another engine or a match server) requests, with the time (minutes for the
+# number of moves) of the request. Every connection is a thread with its own Searcher
+# (see mad100_hub), so games run concurrently; the searches run in background processes
+# and share the transposition table tp of mad100_search.
+#
+# Python 2 has no asyncio: the connections are served by threads (SocketServer).
+#
+# Run from the commandline:
+#   python mad100_dxp.py [--port 27531]
+
+from __future__ import print_function
+import argparse
+import sys
+import threading
+try:
+   import SocketServer as socketserver      # Python 2
+except ImportError:
+   import socketserver
+import mad100
+from mad100_moves import gen_moves
+from mad100_play import parseFEN
+from mad100_hub import Searcher, board_fen, find_move, NAME
+
+DXP_PORT = 27531
+WHITE, BLACK = 0, 1
+COLORS = {'W': WHITE, 'Z': BLACK}
+
+
+def move_message(color, move, secs):
+   # Returns MOVE message of move of color
+   steps = move.steps if color == WHITE else [51 - i for i in move.steps]
+   takes = move.takes if color == WHITE else [51 - i for i in move.takes]
+   return 'M%04d%02d%02d%02d%s' % (min(int(secs), 9999), steps[0], steps[-1], len(takes),
+                                   ''.join('%02d' % i for i in takes))
+
+def parse_move_message(msg):
+   # Returns (from, to, taken squares) of a MOVE message
+   sfrom, sto, n = int(msg[5:7]), int(msg[7:9]), int(msg[9:11])
+   return sfrom, sto, [int(msg[11 + 2 * k:13 + 2 * k]) for k in range(n)]
+
+
+class DXPGame(socketserver.BaseRequestHandler):
+   # One connection: the games of an initiator
+
+   def setup(self):
+      self.buf = b''
+      self.lock = threading.Lock()
+      self.searcher = Searcher()
+      self.waiter = None
+      self.pos, self.tomove, self.engine = None, WHITE, None
+
+   def send(self, msg):
+      with self.lock:
+         self.request.sendall(msg.encode('ascii') + b'\0')
+      self.log('>', msg)
+
+   def log(self, direction, msg):
+      print('%s:%d %s %s' % (self.client_address[0], self.client_address[1], direction, msg))
+
+   def receive(self):
+      # Returns the next message or None if the connection is closed
+      while b'\0' not in self.buf:
+         data = self.request.recv(4096)
+         if not data: return None
+         self.buf += data
+      msg, self.buf = self.buf.split(b'\0', 1)
+      msg = msg.decode('ascii')
+      self.log('<', msg)
+      return msg
+
+   def handle(self):
+      while True:
+         msg = self.receive()
+         if msg is None: break
+         if msg.startswith('R'):
+            self.game_request(msg)
+         elif msg.startswith('M'):
+            self.opponent_move(msg)
+         elif msg.startswith('E'):
+            self.end()
+            self.send('E00')          # confirm
+         elif msg.startswith('B'):
+            self.send('K1')           # take back not supported
+      self.end()
+
+   def end(self):
+      # End the game; a running search is stopped and its move is not played
+      with self.lock:
+         self.pos = None
+      self.stop()
+
+   def stop(self):
+      self.searcher.stop()
+      if self.waiter is not None:
+         self.waiter.join()
+         self.waiter = None
+
+   def game_request(self, msg):
+      # GAMEREQ: setup position and time of the game; think if the engine is to move
+      self.end()
+      if msg[1:3] != '01' or len(msg) < 42:
+         self.send('A%-32s1' % NAME)  # refused: version not supported
+         return
+      self.engine = COLORS.get(msg[35], WHITE)
+      self.clock = int(msg[36:39]) * 60.0
+      self.moves = int(msg[39:42]) or None
+      self.played = 0
+      if msg[42:43] == 'B':
+         side = 'W' if msg[43] == 'W' else 'B'
+         self.pos = parseFEN(board_fen(side, msg[44:94], white='w', black='z'))
+         self.tomove = COLORS.get(msg[43], WHITE)
+      else:
+         self.pos = mad100.newPos(mad100.initial_ext)
+         self.tomove = WHITE
+      self.send('A%-32s0' % NAME)
+      self.next()
+
+   def opponent_move(self, msg):
+      if self.pos is None or self.tomove == self.engine or self.searcher.busy(): return
+      sfrom, sto, takes = parse_move_message(msg)
+      with self.lock:
+         move = find_move(self.tomove, self.pos, sfrom, sto, takes)
+         if move is None:
+            self.pos = None
+         else:
+            self.pos = self.pos.domove(move)
+            self.tomove = 1 - self.tomove
+      if move is None:
+         self.send('E00')             # illegal move: end of game
+         return
+      self.next()
+
+   def next(self):
+      # Think if the engine is to move; game end if the engine has no moves
+      if self.tomove != self.engine: return
+      if not gen_moves(self.pos):
+         self.send('E10')             # I lose
+         self.pos = None
+         return
+      mtg = self.moves - self.played if self.moves and self.played < self.moves else None
+      self.searcher.start(self.pos, clock=self.clock, movestogo=mtg)
+
+      def wait():
+         move, score, depth, nodes, secs, pv = self.searcher.wait()
+         with self.lock:
+            if self.pos is None or move is None: return     # stopped by game end
+            self.clock = max(0.0, self.clock - secs)
+            self.played += 1
+            self.pos = self.pos.domove(move)
+            self.tomove = 1 - self.tomove
+         self.send(move_message(self.engine, move, secs))
+
+      self.waiter = threading.Thread(target=wait)
+      self.waiter.daemon = True
+      self.waiter.start()
+
+# end class DXPGame
+
+
+class DXPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+   daemon_threads = True
+   allow_reuse_address = True
+
+
+###############################################################################
+def main():
+   parser = argparse.ArgumentParser(description='DXP engine server (follower)')
+   parser.add_argument('--host', default='', help='address to listen on (default: all)')
+   parser.add_argument('--port', type=int, default=DXP_PORT, help='TCP port')
+   args = parser.parse_args()
+
+   server = DXPServer((args.host, args.port), DXPGame)
+   print('%s: DXP server on port %d' % (NAME, args.port))
+   try:
+      server.serve_forever()
+   except KeyboardInterrupt:
+      pass
+   server.server_close()
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Endgame tablebases: win/draw/loss (WDL) of all positions with a few pieces
+#=====================================================================
+
+# A table holds the WDL values of all positions of one material signature
+# (men, kings, omen, okings), with the player (uppercase) to move.
+#
+# Index: the squares of each kind of piece are a combination; the index is built of
+# the ranks of the four combinations (combinatorial number system):
+#   men     squares 6..50     (a man on 1..5 is promoted)
+#   omen    squares 1..45
+#   kings   squares 1..50
+#   okings  squares 1..50
+# Indexes with two pieces on one square are not positions (value INVALID).
+#
+# File: data/egtb/<men><kings><omen><okings>.wdl, 2 bits per position (4 per byte).
+# The files are opened with mmap; a probe reads one byte.
+#
+# Generation: the signatures are solved from few to many pieces. A capture leads to
+# fewer pieces and a promotion to fewer men, so these tables are solved before.
+# A signature is solved together with its mirror (players swapped), because the
+# moves without capture or promotion go from one to the other. Solving is by
+# retrograde analysis: a position is a WIN if a move leads to a LOSS of the opponent,
+# and a LOSS if all moves lead to a WIN of the opponent (or there is no move). Starting
+# from the positions decided by their moves to other tables (or no moves), each decided
+# position is propagated to its parents. Positions not decided at the end are a DRAW.
+# Signatures of the same number of pieces and men are solved in parallel.
+#
+# Run from the commandline to generate the tables:
+#   python mad100_egtb.py [<max pieces> [<processes>]]
+
+from __future__ import print_function
+import itertools
+import mmap
+import os
+import sys
+import time
+from array import array
+from multiprocessing import Pool, cpu_count
+import mad100_bitboard
+from mad100_bitboard import BIT, FULL
+from mad100_moves import bitboardMoves, searchCaptures
+
+DRAW, WIN, LOSS, INVALID = 0, 1, 2, 3        # values of a position for the player to move
+
+EGTB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'egtb')
+EGTB_PIECES = 4           # default max number of pieces of the generator
+
+MEN_OFFSET, OMEN_OFFSET, KING_OFFSET = 6, 1, 1      # first square of each kind of piece
+MEN_SQUARES, OMEN_SQUARES, KING_SQUARES = 45, 45, 50
+
+BINOM = [[0] * 51 for n in range(51)]         # BINOM[n][k]: n over k
+for n in range(51):
+   BINOM[n][0] = 1
+   for k in range(1, n + 1):
+      BINOM[n][k] = BINOM[n - 1][k - 1] + BINOM[n - 1][k]
+
+tables = {}               # loaded tables: signature -> mmap
+max_pieces = 0            # max number of pieces of the loaded tables; 0: no tables
+
+
+###############################################################################
+# Signature and index
+###############################################################################
+
+def popcount(x):
+   return bin(x).count('1')
+
+def signature(bb):
+   # Returns material signature of bitboards: (men, kings, omen, okings)
+   return (popcount(bb[0]), popcount(bb[1]), popcount(bb[2]), popcount(bb[3]))
+
+def table_size(sig):
+   # Returns number of indexes of signature sig
+   a, b, c, d = sig
+   return BINOM[MEN_SQUARES][a] * BINOM[OMEN_SQUARES][c] * BINOM[KING_SQUARES][b] * BINOM[KING_SQUARES][d]
+
+def rank(x, offset):
+   # Rank of the combination of the squares of bitboard x (first square: offset)
+   r, k = 0, 0
+   while x:
+      low = x & -x
+      k += 1
+      r += BINOM[low.bit_length() - offset][k]
+      x ^= low
+   return r
+
+def index(bb, sig):
+   # Returns index of bitboards bb of signature sig, or None if a man is on its promotion line
+   men, kings, omen, okings, empty = bb
+   if men & mad100_bitboard.PROMOTION or omen & mad100_bitboard.PROMOTION_ROT:
+      return None
+   a, b, c, d = sig
+   i = rank(men, MEN_OFFSET)
+   i = i * BINOM[OMEN_SQUARES][c] + rank(omen, OMEN_OFFSET)
+   i = i * BINOM[KING_SQUARES][b] + rank(kings, KING_OFFSET)
+   return i * BINOM[KING_SQUARES][d] + rank(okings, KING_OFFSET)
+
+def table_file(sig, directory=EGTB_DIR):
+   return os.path.join(directory, '%d%d%d%d.wdl' % sig)
+
+
+###############################################################################
+# Probing
+###############################################################################
+
+def load(directory=EGTB_DIR):
+   # Open all tables of directory. Returns number of tables.
+   global max_pieces
+   close()
+   if not os.path.isdir(directory): return 0
+   for name in sorted(os.listdir(directory)):
+      if not name.endswith('.wdl') or len(name) != 8: continue
+      sig = tuple(int(c) for c in name[:4])
+      f = open(os.path.join(directory, name), 'rb')
+      tables[sig] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      f.close()
+   # max_pieces: all signatures up to this number of pieces are present
+   n = 2
+   while all(sig in tables for sig in signatures(n) if sum(sig) == n):
+      n += 1
+   max_pieces = n - 1 if n > 2 else 0
+   return len(tables)
+
+def close():
+   global max_pieces
+   for buf in tables.values():
+      buf.close()
+   tables.clear()
+   max_pieces = 0
+
+def probe(bb):
+   # Returns WDL value of bitboards bb for the player to move, or None if not in the tables
+   if not (bb[0] | bb[1]): return LOSS        # no pieces
+   if not (bb[2] | bb[3]): return WIN
+   sig = signature(bb)
+   buf = tables.get(sig)
+   if buf is None: return None
+   i = index(bb, sig)
+   if i is None: return None
+   v = (ord(buf[i >> 2:(i >> 2) + 1]) >> ((i & 3) << 1)) & 3
+   return None if v == INVALID else v
+
+
+###############################################################################
+# Generation
+###############################################################################
+
+def signatures(n):
+   # List of all signatures with at most n pieces and at least one piece of each player
+   res = []
+   for a, b, c, d in itertools.product(range(n + 1), repeat=4):
+      if a + b > 0 and c + d > 0 and a + b + c + d <= n:
+         res.append((a, b, c, d))
+   return res
+
+def mirror(sig):
+   a, b, c, d = sig
+   return (c, d, a, b)
+
+def _combinations(k, offset, nsquares):
+   # List of (rank, bitboard) of all combinations of k squares
+   res = []
+   for squares in itertools.combinations(range(offset, offset + nsquares), k):
+      x = 0
+      for sq in squares: x |= BIT[sq]
+      res.append((rank(x, offset), x))
+   return res
+
+def positions(sig):
+   # Generator of (index, bitboards) of all positions of signature sig
+   a, b, c, d = sig
+   for rm, men in _combinations(a, MEN_OFFSET, MEN_SQUARES):
+      for ro, omen in _combinations(c, OMEN_OFFSET, OMEN_SQUARES):
+         if men & omen: continue
+         i1 = rm * BINOM[OMEN_SQUARES][c] + ro
+         for rk, kings in _combinations(b, KING_OFFSET, KING_SQUARES):
+            if kings & (men | omen): continue
+            i2 = i1 * BINOM[KING_SQUARES][b] + rk
+            for rok, okings in _combinations(d, KING_OFFSET, KING_SQUARES):
+               if okings & (men | omen | kings): continue
+               yield (i2 * BINOM[KING_SQUARES][d] + rok,
+                      (men, kings, omen, okings, FULL & ~(men | kings | omen | okings)))
+
+def _board(bb):
+   # Board (list of 52 char) of bitboards
+   board = ['0'] + ['.'] * 50 + ['0']
+   for x, p in zip(bb[:4], 'PKpk'):
+      while x:
+         low = x & -x
+         board[low.bit_length()] = p
+         x ^= low
+   return board
+
+def children(bb, sig):
+   # List of (bitboards, signature) after each legal move of bb with signature sig.
+   # The bitboards are rotated: the opponent is to move.
+   moves = bitboardMoves(bb)
+   if len(moves) > 0 and len(moves[0].takes) > 0:
+      moves = searchCaptures(_board(bb), moves)
+   men, kings, omen, okings, empty = bb
+   a, b, c, d = sig
+   res = []
+   for m in moves:
+      i, j = m.steps[0], m.steps[-1]
+      promotion = 1 if men & BIT[i] and BIT[j] & mad100_bitboard.PROMOTION else 0
+      tkings = sum(1 for k in m.takes if okings & BIT[k])
+      res.append((mad100_bitboard.domove(bb, i, j, m.takes),
+                  (c - len(m.takes) + tkings, d - tkings, a - promotion, b + promotion)))
+   return res
+
+def solve(sigs, directory=EGTB_DIR):
+   # Solve a signature and its mirror (sigs) and write the tables.
+   # The tables of fewer pieces or men must be in directory. Returns (sigs, counts of WDL).
+   load(directory)
+   base, total = {}, 0           # all positions of sigs have one index: base[sig] + index
+   for sig in sigs:
+      base[sig] = total
+      total += table_size(sig)
+   vals = bytearray([INVALID]) * total
+   count = bytearray(total)      # number of children in sigs not decided yet
+   draw = bytearray(total)       # 1: a child outside sigs is a draw, so the position is no LOSS
+   edges = array('I'), array('I')    # (child, parent) of the moves within sigs
+   decided = []                  # positions decided, not yet propagated to the parents
+
+   # Pass 1: generate the moves of all positions; children outside sigs are known
+   for sig in sigs:
+      for i, bb in positions(sig):
+         g = base[sig] + i
+         vals[g] = DRAW
+         n, win = 0, False
+         for cbb, csig in children(bb, sig):
+            if csig in base:
+               edges[0].append(base[csig] + index(cbb, csig))
+               edges[1].append(g)
+               n += 1
+               continue
+            v = probe(cbb)
+            if v == LOSS: win = True
+            elif v != WIN: draw[g] = 1
+         if win or n == 0 and not draw[g]:
+            vals[g] = WIN if win else LOSS      # LOSS: no moves or all moves lead to a WIN
+            decided.append(g)
+         count[g] = n
+
+   # Parents of each position (sorted by child)
+   first = array('I', [0]) * (total + 1)
+   for c in edges[0]: first[c + 1] += 1
+   for g in range(total): first[g + 1] += first[g]
+   fill = array('I', first)
+   parents = array('I', [0]) * len(edges[0])
+   for c, p in zip(*edges):
+      parents[fill[c]] = p
+      fill[c] += 1
+   del edges, fill
+
+   # Pass 2: retrograde propagation of the decided positions
+   while decided:
+      c = decided.pop()
+      v = vals[c]
+      for p in parents[first[c]:first[c + 1]]:
+         if vals[p] != DRAW: continue          # decided before
+         if v == LOSS:
+            vals[p] = WIN
+            decided.append(p)
+         else:
+            count[p] -= 1
+            if count[p] == 0 and not draw[p]:
+               vals[p] = LOSS
+               decided.append(p)
+
+   close()
+   counts = {}
+   for sig in sigs:
+      tvals = vals[base[sig]:base[sig] + table_size(sig)]
+      packed = bytearray((len(tvals) + 3) // 4)
+      for i in range(len(tvals)):
+         packed[i >> 2] |= tvals[i] << ((i & 3) << 1)
+      out = open(table_file(sig, directory) + '.tmp', 'wb')
+      out.write(packed)
+      out.close()
+      os.rename(table_file(sig, directory) + '.tmp', table_file(sig, directory))   # complete files only
+      counts[sig] = tuple(sum(1 for v in tvals if v == x) for x in (WIN, DRAW, LOSS))
+   return sigs, counts
+
+def _solve(args):
+   return solve(*args)
+
+def generate(n=EGTB_PIECES, processes=1, directory=EGTB_DIR):
+   # Generate the tables of all signatures with at most n pieces
+   if not os.path.isdir(directory):
+      os.makedirs(directory)
+   groups = {}           # (pieces, men) -> list of signature pairs
+   for sig in signatures(n):
+      if mirror(sig) < sig: continue
+      pair = (sig,) if mirror(sig) == sig else (sig, mirror(sig))
+      groups.setdefault((sum(sig), sig[0] + sig[2]), []).append(pair)
+
+   pool = Pool(processes) if processes > 1 else None
+   try:
+      for key in sorted(groups):
+         start = time.time()
+         tasks = [(pair, directory) for pair in groups[key]]
+         results = pool.map(_solve, tasks) if pool is not None else [_solve(t) for t in tasks]
+         for sigs, counts in results:
+            for sig in sigs:
+               print('%d%d%d%d  win: %8d  draw: %8d  loss: %8d' % (sig + counts[sig]))
+         print('pieces: %d  men: %d  tables: %d  time: %.1f' % (key[0], key[1],
+               sum(len(pair) for pair in groups[key]), time.time() - start))
+   finally:
+      if pool is not None:
+         pool.close()
+         pool.join()
+
+
+###############################################################################
+def main():
+   n = int(sys.argv[1]) if len(sys.argv) > 1 else EGTB_PIECES
+   processes = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count()
+   generate(n, processes)
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Hub protocol front end (draughts GUIs)
+#=====================================================================
+
+# The Hub protocol is a line protocol on stdin/stdout. Commands of the GUI:
+#   hub                                 -> id ... / param ... / wait
+#   init                                -> ready
+#   new-game
+#   pos [start] [pos=<position>] [moves="<move> ..."]
+#       position: side to move (W or B) and 50 squares (w, b, W, B: kings, e: empty)
+#       moves in Hub notation: 32-28, captures from x to x taken squares: 28x19x23
+#   level [nodes=<n>] [move-time=<s>] [time=<s> [inc=<s>] [moves=<n>]] [infinite]
+#   time left=<s>                       remaining time of the clock
+#   go think | go analyze               -> info ... / done move=<move>
+#   go ponder                           search the position after the expected move of the
+#                                       opponent (the ponder move of done) until:
+#   ponder-hit                          the opponent played it: the limits of the search start
+#   stop                                (also a ponder miss)
+#   ping                                -> pong
+#   set-param name=book value=<bool>
+#   quit
+#
+# The search runs in a background process (see Searcher), so the commands (stop, ping)
+# are read while the engine thinks. The background process is forked: it shares the
+# transposition table tp of mad100_search (shared memory) with the front end and with
+# the searches of the next moves.
+#
+# The protocol needs asynchronous I/O. Python 2 has no asyncio: the front end uses a
+# thread that waits for the result of the search, and the search itself runs in a process.
+#
+# Run from the commandline (a GUI starts the engine with this command):
+#   python mad100_hub.py
+
+from __future__ import print_function
+import multiprocessing
+import os
+import shlex
+import sys
+import threading
+import time
+try:
+   from Queue import Empty        # Python 2
+except ImportError:
+   from queue import Empty
+import mad100
+import mad100_search
+from mad100_moves import gen_moves, clearMoveTable
+from mad100_play import parseFEN
+from mad100_time import TimeControl
+
+NAME = 'mad100'
+VERSION = '1.0'
+WHITE, BLACK = 0, 1
+SEARCH_WAIT = 1.0         # seconds between checks of the search process when waiting for its result
+
+
+###############################################################################
+# Background search
+###############################################################################
+
+class BackgroundControl(TimeControl):
+   # TimeControl of a search in a background process. The search also stops on the
+   # stop event of the front end and at the end of an iteration after maxn nodes.
+   # Without limits (infinite) the search runs until stopped.
+   # Pondering: with a hit event the search runs without limits on the expected move
+   # of the opponent until the hit event (ponder hit: the limits start now) or the
+   # stop event (ponder miss).
+
+   def __init__(self, event, maxn=None, movetime=None, clock=None, inc=0.0, movestogo=None, hit=None):
+      self.event = event
+      self.maxn = maxn
+      self.hit = hit
+      self.ponder = hit is not None
+      TimeControl.__init__(self, movetime, clock, inc, movestogo)
+
+   def pondering(self):
+      # Returns True while the search is pondering
+      if self.ponder and self.hit.is_set():
+         self.ponder = False
+         self.t0 = time.time()         # the limits start at the ponder hit
+      return self.ponder
+
+   def poll(self):
+      if self.event.is_set(): self.stopped = True
+      if self.pondering(): return self.stopped and self.abortable
+      return TimeControl.poll(self)
+
+   def iteration_done(self, nodes):
+      if self.event.is_set(): self.stopped = True
+      more = TimeControl.iteration_done(self, nodes)
+      if self.pondering(): return not self.stopped
+      return more and (self.maxn is None or nodes < self.maxn)
+
+# end class BackgroundControl
+
+def search_worker(pos, tc, results):
+   # Background process: search pos; puts (move, score, depth, nodes, seconds, pv) on results
+   sys.stdout = open(os.devnull, 'w')
+   start = time.time()
+   move, score = mad100_search.search(pos, tc=tc)
+   while tc.pondering() and not tc.event.is_set():
+      tc.hit.wait(0.05)            # search done before the ponder hit: wait for hit or stop
+   if tc.hit is not None and tc.hit.is_set():
+      start = tc.t0                # time from the ponder hit
+   pv = []
+   for entry in mad100_search.gen_pv(pos, mad100_search.tp):
+      if entry.move is None: break
+      pv.append(entry.move)
+   if move is not None and pv[:1] != [move]:
+      pv = [move]          # tp holds the root of an aborted iteration
+   results.put((move, score, mad100_search.search_depth, mad100_search.stats.nodes,
+                time.time() - start, pv))
+
+class Searcher:
+   # A search in a background process; one at a time
+
+   def __init__(self):
+      self.proc = None
+
+   def start(self, pos, maxn=None, movetime=None, clock=None, inc=0.0, movestogo=None, ponder=False):
+      # Start the search of pos with the limits; with ponder the limits start at hit()
+      self.event = multiprocessing.Event()
+      self.hit_event = multiprocessing.Event() if ponder else None
+      self.results = multiprocessing.Queue()
+      self.pos = pos
+      tc = BackgroundControl(self.event, maxn, movetime, clock, inc, movestogo, self.hit_event)
+      self.proc = multiprocessing.Process(target=search_worker, args=(pos, tc, self.results))
+      self.proc.daemon = True
+      self.proc.start()
+
+   def busy(self):
+      return self.proc is not None
+
+   def stop(self):
+      # Stop the search; the result follows as soon as possible
+      if self.proc is not None:
+         self.event.set()
+
+   def hit(self):
+      # Ponder hit: the search goes on with its limits
+      if self.proc is not None and self.hit_event is not None:
+         self.hit_event.set()
+
+   def wait(self):
+      # Returns the result of the search: (move, score, depth, nodes, seconds, pv).
+      # If the search process died without result, the first legal move is returned.
+      start = time.time()
+      while True:
+         try:
+            res = self.results.get(timeout=SEARCH_WAIT)
+            break
+         except Empty:
+            if self.proc.is_alive(): continue
+            try:
+               res = self.results.get(timeout=SEARCH_WAIT)     # result put just before the exit
+               break
+            except Empty:
+               pass
+            moves = gen_moves(self.pos)
+            move = moves[0] if moves else None
+            print('search process died (exit code %s); move: first legal move' % self.proc.exitcode,
+                  file=sys.stderr)
+            res = (move, 0, 0, 0, time.time() - start, [] if move is None else [move])
+            break
+      self.proc.join()
+      self.proc = None
+      return res
+
+# end class Searcher
+
+
+###############################################################################
+# Notation
+###############################################################################
+
+def board_fen(side, squares, white='w', black='b'):
+   # Returns FEN of side to move ('W' or 'B') and string of 50 squares with the chars
+   # white and black for the men and the upper case chars for the kings
+   wpieces, bpieces = [], []
+   for i, c in enumerate(squares, 1):
+      if c in (white, white.upper()):
+         wpieces.append(('K%d' if c == white.upper() else '%d') % i)
+      elif c in (black, black.upper()):
+         bpieces.append(('K%d' if c == black.upper() else '%d') % i)
+   return '%s:W%s:B%s' % (side, ','.join(wpieces), ','.join(bpieces))
+
+def find_move(color, pos, sfrom, sto, takes):
+   # Returns the legal move of pos with from, to and taken squares (numbers of white) or None
+   if color == BLACK:
+      sfrom, sto, takes = 51 - sfrom, 51 - sto, [51 - i for i in takes]
+   for move in gen_moves(pos):
+      if move.steps[0] == sfrom and move.steps[-1] == sto and (
+            not takes or sorted(move.takes) == sorted(takes)):
+         return move
+   return None
+
+def hub_move(color, move):
+   # Returns move in Hub notation
+   steps = move.steps if color == WHITE else [51 - i for i in move.steps]
+   takes = move.takes if color == WHITE else [51 - i for i in move.takes]
+   if not takes:
+      return '%d-%d' % (steps[0], steps[-1])
+   return 'x'.join(str(i) for i in [steps[0], steps[-1]] + sorted(takes))
+
+def parse_hub_move(color, pos, s):
+   # Returns the legal move of pos of a move in Hub notation (or 32-28, 26x37) or None
+   sep = 'x' if 'x' in s else '-'
+   try:
+      squares = [int(i) for i in s.split(sep)]
+   except ValueError:
+      return None
+   if len(squares) < 2: return None
+   return find_move(color, pos, squares[0], squares[1], squares[2:])
+
+
+###############################################################################
+# Hub protocol
+###############################################################################
+
+def parse_line(line):
+   # Returns command and dict of the arguments name=value (or name: True) of a Hub line
+   try:
+      words = shlex.split(line)
+   except ValueError:
+      return None, {}
+   if not words: return None, {}
+   args = {}
+   for word in words[1:]:
+      name, sep, value = word.partition('=')
+      args[name] = value if sep else True
+   return words[0], args
+
+class Hub:
+   # State of the Hub front end
+
+   def __init__(self, out=sys.stdout):
+      self.out = out
+      self.lock = threading.Lock()         # one writer at a time
+      self.searcher = Searcher()
+      self.waiter = None
+      self.new_game()
+      self.limits = {'maxn': mad100_search.MAX_NODES}
+      self.tc = None                       # game clock (TimeControl) or None
+
+   def send(self, line):
+      with self.lock:
+         self.out.write(line + '\n')
+         self.out.flush()
+
+   def new_game(self):
+      self.pos = mad100.newPos(mad100.initial_ext)
+      self.color = WHITE
+
+   def set_pos(self, args):
+      # pos [start] [pos=...] [moves="..."]
+      if 'pos' in args:
+         p = args['pos']
+         self.pos = parseFEN(board_fen(p[0], p[1:51]))
+         self.color = BLACK if p[0] == 'B' else WHITE
+      else:
+         self.new_game()
+      for s in args.get('moves', '').split():
+         move = parse_hub_move(self.color, self.pos, s)
+         if move is None:
+            self.send('error message="illegal move %s"' % s)
+            return
+         self.pos = self.pos.domove(move)
+         self.color = 1 - self.color
+
+   def set_level(self, args):
+      # level [nodes=n] [move-time=s] [time=s [inc=s] [moves=n]] [infinite]
+      self.limits, self.tc = {}, None
+      if 'nodes' in args: self.limits['maxn'] = int(args['nodes'])
+      if 'move-time' in args: self.limits['movetime'] = float(args['move-time'])
+      if 'time' in args:
+         moves = int(args['moves']) if 'moves' in args else None
+         self.tc = TimeControl(clock=float(args['time']), inc=float(args.get('inc', 0.0)), movestogo=moves)
+      if not self.limits and self.tc is None and 'infinite' not in args:
+         self.limits['maxn'] = mad100_search.MAX_NODES
+
+   def go(self, mode):
+      # Start the search of the position; the result is sent by a waiter thread
+      if self.searcher.busy(): return
+      limits = dict(self.limits)
+      if mode == 'analyze':
+         limits = {}                       # until stop
+      elif self.tc is not None:
+         limits.update(clock=self.tc.clock, inc=self.tc.inc, movestogo=self.tc.movestogo)
+      pos, color, tc = self.pos, self.color, self.tc
+      self.searcher.start(pos, ponder=(mode == 'ponder'), **limits)
+      hit = self.searcher.hit_event
+
+      def wait():
+         move, score, depth, nodes, secs, pv = self.searcher.wait()
+         if tc is not None and (mode == 'think' or hit is not None and hit.is_set()):
+            tc.used(secs)                  # after a ponder hit: the time from the hit
+         pvs, c = [], color
+         for m in pv:
+            pvs.append(hub_move(c, m))
+            c = 1 - c
+         self.send('info depth=%d score=%d nodes=%d time=%.3f pv="%s"' %
+                   (depth, score, nodes, secs, ' '.join(pvs)))
+         if move is None:
+            self.send('error message="no move"')
+         else:
+            self.send('done move=%s' % hub_move(color, move) + (' ponder=%s' % pvs[1] if len(pvs) > 1 else ''))
+
+      self.waiter = threading.Thread(target=wait)
+      self.waiter.daemon = True
+      self.waiter.start()
+
+   def stop(self):
+      self.searcher.stop()
+      if self.waiter is not None:
+         self.waiter.join()
+         self.waiter = None
+
+   def command(self, line):
+      # Handle one line of the GUI. Returns False after quit.
+      cmd, args = parse_line(line)
+      if cmd is None:
+         return True
+      if cmd == 'hub':
+         self.send('id name=%s version=%s' % (NAME, VERSION))
+         self.send('param name=book value=%s type=bool' % ('true' if mad100_search.book_bin else 'false'))
+         self.send('wait')
+      elif cmd == 'init':
+         self.send('ready')
+      elif cmd == 'ping':
+         self.send('pong')
+      elif cmd == 'quit':
+         self.stop()
+         return False
+      elif cmd == 'stop':
+         self.stop()
+      elif cmd == 'new-game':
+         self.stop()
+         self.new_game()
+         mad100_search.clearSearchTables()
+         clearMoveTable()
+      elif cmd == 'pos':
+         self.stop()
+         self.set_pos(args)
+      elif cmd == 'level':
+         self.set_level(args)
+      elif cmd == 'time':
+         if self.tc is not None and 'left' in args:
+            self.tc.clock = float(args['left'])
+      elif cmd == 'go':
+         self.go('analyze' if 'analyze' in args else 'ponder' if 'ponder' in args else 'think')
+      elif cmd == 'ponder-hit':
+         self.searcher.hit()
+      elif cmd == 'set-param':
+         if args.get('name') == 'book':
+            if args.get('value') == 'true':
+               mad100_search.book_openBinary(mad100_search.mad100_book.BINARY_BOOK_FILE,
+                                             mad100_search.mad100_book.BOOK_FILE)
+            else:
+               mad100_search.book_closeBinary()
+      else:
+         self.send('error message="unknown command %s"' % cmd)
+      return True
+
+# end class Hub
+
+
+###############################################################################
+def main():
+   hub = Hub(sys.stdout)
+   sys.stdout = sys.stderr            # other output of the engine is not for the GUI
+   while True:
+      line = sys.stdin.readline()
+      if line == '' or not hub.command(line.strip()):
+         break
+   hub.stop()
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Engine-vs-engine match runner
+#=====================================================================
+
+# Plays two configurations of the engine (A and B) against each other to check
+# that a change (PST, search switches, node budget) makes the engine stronger.
+#
+# - An engine configuration is a list of settings NAME=VALUE of module globals;
+#   NAME is a global of mad100_search (like nullswitch, NULL_R, valWINDOW, MAX_NODES)
+#   or module.NAME (like mad100.PMAT). The values are Python literals.
+#   The setting method=mtd|ab|f selects the search function (see mad100_batch.METHODS).
+#   The settings are made before every move of the engine and undone after it.
+# - Every start position (the openings of a text book or PDN file up to a number of
+#   plies, or the FENs of a file) is played twice, with colours reversed.
+# - The games are divided over a process pool; each engine has its own transposition
+#   table in each process, cleared at the start of a game.
+# - Limits: fixed number of nodes or fixed time per move.
+# - Adjudication: win if both engines agree on a score of at least ADJ_SCORE for
+#   ADJ_PLIES plies or if the endgame tablebases know the result; draw by threefold
+#   repetition, after KING_PLIES plies of only king moves without capture, or after MAX_PLIES.
+# - The games are written as PDN. The match stops as soon as the SPRT (sequential
+#   probability ratio test) accepts H0 (elo <= elo0) or H1 (elo >= elo1) for A vs B.
+#
+# Run from the commandline:
+#   python mad100_match.py -a valWINDOW=30 -b valWINDOW=50 [options]
+
+from __future__ import print_function
+from __future__ import division
+import argparse
+import ast
+import importlib
+import math
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+import mad100
+import mad100_search
+import mad100_book
+import mad100_egtb
+from mad100_moves import gen_moves, clearMoveTable
+from mad100_play import parseFEN, mrender_move, mparse_move
+from mad100_time import TimeControl
+from mad100_tt import TransTable
+from mad100_batch import METHODS, read_fens, init_worker
+from mad100_bookbuild import read_games
+
+MATCH_PLIES = 8           # plies of the openings used as start positions
+MAX_PLIES = 300           # draw after this number of plies
+KING_PLIES = 50           # draw after this number of plies with only king moves (25 moves each)
+ADJ_SCORE = 2000          # adjudicate a win if both engines agree on this score (two men) ...
+ADJ_PLIES = 8             # ... for this number of plies
+
+WHITE, BLACK = 0, 1
+NAMES = ('A', 'B')
+
+tables = {}               # name of engine -> transposition table (per process)
+
+
+###############################################################################
+# Engine settings
+###############################################################################
+
+def parse_setting(s):
+   # Returns (module name, name, value) of setting 'NAME=VALUE' or 'module.NAME=VALUE'
+   name, sep, value = s.partition('=')
+   if not sep: raise ValueError('setting must be NAME=VALUE: ' + s)
+   name = name.strip()
+   module, dot, attr = name.rpartition('.')
+   if name == 'method':
+      if value.strip() not in METHODS: raise ValueError('unknown method: ' + value)
+      return ('', 'method', value.strip())
+   module = module or 'mad100_search'
+   if not hasattr(importlib.import_module(module), attr):
+      raise ValueError('unknown setting: ' + name)
+   try:
+      value = ast.literal_eval(value.strip())
+   except (ValueError, SyntaxError):
+      raise ValueError('value must be a Python literal: ' + s)
+   return (module, attr, value)
+
+def apply_settings(settings):
+   # Make the settings; returns the settings that undo them
+   undo = []
+   for module, attr, value in settings:
+      if not module: continue             # method
+      m = importlib.import_module(module)
+      undo.append((module, attr, getattr(m, attr)))
+      setattr(m, attr, value)
+   return undo[::-1]
+
+def method_of(settings):
+   for module, attr, value in settings:
+      if not module and attr == 'method': return value
+   return 'mtd'
+
+
+###############################################################################
+# Games
+###############################################################################
+
+def start_position(start):
+   # Returns (position, first color, moves) of a start: a FEN or a list of opening moves.
+   # The position is the position after the moves; first is the color to move before them.
+   if isinstance(start, str):
+      return parseFEN(start), (BLACK if start.strip()[0] == 'B' else WHITE), []
+   pos, color, moves = mad100.newPos(mad100.initial_ext), WHITE, []
+   for smove in start:
+      move = mad100.match_move(pos, mparse_move(color, smove))
+      if move is None or move not in gen_moves(pos):
+         raise ValueError('illegal move: ' + smove)
+      moves.append(move)
+      pos = pos.domove(move)
+      color = 1 - color
+   return pos, WHITE, moves
+
+def engine_move(name, settings, pos, maxn, movetime):
+   # Search pos with engine settings. Returns move and score (view of the side to move).
+   func, tname, nname = METHODS[method_of(settings)]
+   undo = apply_settings([('mad100_search', 'MAX_NODES', maxn)] + settings)
+   saved = getattr(mad100_search, tname)
+   try:
+      setattr(mad100_search, tname, tables[name])
+      spos = mad100.Position(list(pos.board), 0)   # score with the evaluation of this engine
+      spos.score = spos.eval_pos()
+      tc = TimeControl(movetime=movetime) if movetime is not None else None
+      return func(spos, mad100_search.MAX_NODES, tc=tc)
+   finally:
+      setattr(mad100_search, tname, saved)
+      apply_settings(undo)
+
+def is_king_move(pos, move):
+   return pos.board[move.steps[0]] == 'K' and not move.takes
+
+def play_game(task):
+   # Worker: play one game. task is (game number, start, name of white engine, settings
+   # of both engines, max nodes, movetime). Returns the game as dict.
+   n, start, white, settings, maxn, movetime = task
+   for name in NAMES:
+      if name not in tables:
+         tables[name] = TransTable(mad100_search.TABLE_SIZE_MB)
+      tables[name].clear()
+   clearMoveTable()
+
+   pos, first, moves = start_position(start)
+   color = (first + len(moves)) % 2
+   engines = (white, NAMES[1 - NAMES.index(white)])      # by color
+   seen = {pos.key(): 1}
+   result, reason = None, None
+   adj, adj_sign, king_plies = 0, 0, 0
+   nstart = len(moves)
+
+   while result is None:
+      legal = gen_moves(pos)
+      if not legal:
+         result, reason = (BLACK if color == WHITE else WHITE), 'no moves'
+         break
+      if mad100_egtb.max_pieces:
+         bb = pos.bitboards()
+         if mad100_egtb.popcount(bb[0] | bb[1] | bb[2] | bb[3]) <= mad100_egtb.max_pieces:
+            wdl = mad100_egtb.probe(bb)
+            if wdl is not None:
+               result = {mad100_egtb.WIN: color, mad100_egtb.LOSS: 1 - color}.get(wdl, -1)
+               reason = 'endgame tablebases'
+               break
+
+      name = engines[color]
+      move, score = engine_move(name, settings[name], pos, maxn, movetime)
+      if move is None or move not in legal:
+         result, reason = 1 - color, 'no move from engine %s' % name
+         break
+
+      # Win adjudication: both engines see the same side winning
+      wscore = score if color == WHITE else -score
+      sign = 1 if wscore >= ADJ_SCORE else -1 if wscore <= -ADJ_SCORE else 0
+      adj = adj + 1 if sign != 0 and sign == adj_sign else (1 if sign != 0 else 0)
+      adj_sign = sign
+      king_plies = king_plies + 1 if is_king_move(pos, move) else 0
+
+      moves.append(move)
+      pos = pos.domove(move)
+      color = 1 - color
+      seen[pos.key()] = seen.get(pos.key(), 0) + 1
+
+      if adj >= ADJ_PLIES:
+         result, reason = (WHITE if adj_sign > 0 else BLACK), 'score adjudication'
+      elif seen[pos.key()] >= 3:
+         result, reason = -1, 'threefold repetition'
+      elif king_plies >= KING_PLIES:
+         result, reason = -1, '25 king moves'
+      elif len(moves) - nstart >= MAX_PLIES:
+         result, reason = -1, 'max plies'
+
+   return {'n': n, 'start': start, 'first': first, 'moves': render_moves(first, moves),
+           'white': engines[WHITE], 'black': engines[BLACK],
+           'result': {WHITE: '2-0', BLACK: '0-2', -1: '1-1'}[result], 'reason': reason}
+
+def render_moves(first, moves):
+   # Returns list of the moves of a game in numeric format
+   res, color = [], first
+   for move in moves:
+      res.append(mrender_move(color, move))
+      color = 1 - color
+   return res
+
+def pdn_game(game, event='mad100 match'):
+   # Returns the game as PDN text
+   tags = [('Event', event), ('Round', str(game['n'] + 1)), ('White', game['white']),
+           ('Black', game['black']), ('Result', game['result'])]
+   if isinstance(game['start'], str):
+      tags.append(('FEN', game['start'].strip()))
+   lines = ['[%s "%s"]' % tag for tag in tags]
+   text, num = [], 1
+   moves = game['moves']
+   if game['first'] == BLACK:
+      text.append('1...')
+      moves = [None] + moves
+   for i, move in enumerate(moves):
+      if i % 2 == 0 and move is not None:
+         text.append('%d.' % (i // 2 + 1))
+      if move is not None: text.append(move)
+   text.append('{%s}' % game['reason'])
+   text.append(game['result'])
+   words, line = [], ''
+   for word in text:                       # lines of at most 80 characters
+      if len(line) + len(word) + 1 > 80:
+         words.append(line)
+         line = word
+      else:
+         line = word if line == '' else line + ' ' + word
+   words.append(line)
+   return '\n'.join(lines) + '\n\n' + '\n'.join(words) + '\n\n'
+
+
+###############################################################################
+# Statistics
+###############################################################################
+
+def expected_score(elo):
+   return 1 / (1 + 10 ** (-elo / 400))
+
+def elo(wins, draws, losses):
+   # Returns elo difference of the score, or None if the score is 0 or 1
+   n = wins + draws + losses
+   if n == 0: return None
+   s = (wins + draws / 2) / n
+   if s <= 0 or s >= 1: return None
+   return -400 * math.log10(1 / s - 1)
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+   # Log likelihood ratio of H1 (elo = elo1) vs H0 (elo = elo0); normal approximation
+   # of the trinomial distribution of the game results.
+   n = wins + draws + losses
+   if n == 0: return 0.0
+   s = (wins + draws / 2) / n
+   var = (wins * (1 - s) ** 2 + draws * (0.5 - s) ** 2 + losses * s ** 2) / n
+   if var == 0: return 0.0
+   s0, s1 = expected_score(elo0), expected_score(elo1)
+   return n * (s1 - s0) * (2 * s - s0 - s1) / (2 * var)
+
+def sprt_bounds(alpha, beta):
+   # Returns (lower, upper) bounds of the LLR: accept H0 below lower, H1 above upper
+   return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+###############################################################################
+# Match
+###############################################################################
+
+def read_starts(openings=(), fens=(), plies=MATCH_PLIES):
+   # Returns the start positions: lists of opening moves (unique up to plies) and FENs
+   starts, keys = [], set()
+   for f in openings:
+      for moves in read_games(f):
+         moves = moves[:plies]
+         try:
+            pos, first, dummy = start_position(moves)
+         except ValueError as e:
+            print('Opening skipped (%s) in %s' % (e, f), file=sys.stderr)
+            continue
+         if pos.key() not in keys:
+            keys.add(pos.key())
+            starts.append(moves)
+   for f in fens:
+      for n, fen in read_fens(open(f, 'r')):
+         starts.append(fen)
+   return starts
+
+def init_match_worker(egtb_dir):
+   init_worker()
+   if egtb_dir: mad100_egtb.load(egtb_dir)
+
+def run_match(starts, settings, out, maxn=mad100_search.MAX_NODES, movetime=None, processes=1,
+              games=None, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05, egtb_dir=None):
+   # Play the match; the games are written as PDN to file object out.
+   # Returns the score (wins, draws, losses) of A and the SPRT decision (None, 'H0' or 'H1').
+   tasks = []
+   for i, start in enumerate(starts):
+      for white in NAMES:                        # colours reversed
+         tasks.append((len(tasks), start, white, settings, maxn, movetime))
+   if games is not None: tasks = tasks[:games]
+
+   lower, upper = sprt_bounds(alpha, beta)
+   wins = draws = losses = 0
+   decision = None
+   pool = Pool(processes, init_match_worker, (egtb_dir,))
+   try:
+      for game in pool.imap_unordered(play_game, tasks):
+         out.write(pdn_game(game))
+         out.flush()
+         if game['result'] == '1-1':
+            draws += 1
+         elif (game['result'] == '2-0') == (game['white'] == 'A'):
+            wins += 1
+         else:
+            losses += 1
+         llr = sprt_llr(wins, draws, losses, elo0, elo1)
+         e = elo(wins, draws, losses)
+         print('games: %4d  A: +%d =%d -%d  elo: %s  LLR: %.2f (%.2f, %.2f)' %
+               (wins + draws + losses, wins, draws, losses,
+                '%+.1f' % e if e is not None else '-', llr, lower, upper), file=sys.stderr)
+         if llr <= lower or llr >= upper:
+            decision = 'H0' if llr <= lower else 'H1'
+            break
+   finally:
+      pool.terminate()
+      pool.join()
+   return (wins, draws, losses), decision
+
+
+###############################################################################
+def main():
+   parser = argparse.ArgumentParser(description='Engine-vs-engine match with SPRT')
+   parser.add_argument('-a', action='append', default=[], metavar='NAME=VALUE', help='setting of engine A')
+   parser.add_argument('-b', action='append', default=[], metavar='NAME=VALUE', help='setting of engine B')
+   parser.add_argument('--openings', nargs='*', help='text books or PDN files (default: %s)' % mad100_book.BOOK_FILE)
+   parser.add_argument('--fens', nargs='*', default=[], help='files with start positions (FEN per line)')
+   parser.add_argument('--plies', type=int, default=MATCH_PLIES, help='plies of the openings')
+   parser.add_argument('-n', '--nodes', type=int, default=mad100_search.MAX_NODES, help='max nodes per move')
+   parser.add_argument('-t', '--time', type=float, help='seconds per move (instead of nodes)')
+   parser.add_argument('-g', '--games', type=int, help='max number of games')
+   parser.add_argument('-p', '--processes', type=int, default=cpu_count(), help='number of processes')
+   parser.add_argument('-o', '--output', help='PDN file of the games (default: stdout)')
+   parser.add_argument('--elo0', type=float, default=0.0, help='SPRT: elo of H0')
+   parser.add_argument('--elo1', type=float, default=10.0, help='SPRT: elo of H1')
+   parser.add_argument('--alpha', type=float, default=0.05, help='SPRT: false positive rate')
+   parser.add_argument('--beta', type=float, default=0.05, help='SPRT: false negative rate')
+   parser.add_argument('--egtb', help='directory of endgame tablebases for the engines and adjudication')
+   args = parser.parse_args()
+
+   try:
+      settings = {'A': [parse_setting(s) for s in args.a], 'B': [parse_setting(s) for s in args.b]}
+   except (ValueError, ImportError) as e:
+      parser.error(str(e))
+   openings = args.openings
+   if openings is None: openings = [] if args.fens else [mad100_book.BOOK_FILE]
+   starts = read_starts(openings, args.fens, args.plies)
+   if not starts: parser.error('no start positions')
+
+   out = open(args.output, 'w') if args.output else sys.stdout
+   start = time.time()
+   (wins, draws, losses), decision = run_match(starts, settings, out, args.nodes, args.time,
+         max(1, args.processes), args.games, args.elo0, args.elo1, args.alpha, args.beta, args.egtb)
+   e = elo(wins, draws, losses)
+   print('A: %s  B: %s' % (' '.join(args.a) or 'default', ' '.join(args.b) or 'default'), file=sys.stderr)
+   print('Result A: +%d =%d -%d  elo: %s  SPRT: %s  time: %.1f' %
+         (wins, draws, losses, '%+.1f' % e if e is not None else '-',
+          {'H0': 'H0 accepted (no gain)', 'H1': 'H1 accepted (gain)', None: 'no decision'}[decision],
+          time.time() - start), file=sys.stderr)
+   return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
-from collections import OrderedDict, namedtuple
+from array import array
+from collections import namedtuple
+import mad100_bitboard
 
 #=====================================================================
 # Move logic for Draughts 100 International Rules
@@ -81,10 +83,157 @@ def diagonal(i, d):
 
 directions = [NE, SE, SW, NW]
 
-Move = namedtuple('Move', 'steps takes')      # steps/takes are arrays of numbers 
+# Ray of squares from each square in each direction (same order as directions)
+RAYS = mad100_bitboard.RAY
+
+# Row of each square and the squares off the edge of the board (pieces on the edge cannot be taken)
+ROW = [0] + [(i - 1) // 5 for i in range(1, 51)] + [0]
+INNER = [i for i in range(1, 51) if NE[i] and SE[i] and SW[i] and NW[i]]
+
+Move = namedtuple('Move', 'steps takes')      # steps/takes are tuples of square numbers
+
+# A move is immutable (a tuple of two tuples of small ints), so moves are shared: every
+# move without capture is an object of QUIET_MOVES, indexed by from | to << 6.
+QUIET_MOVES = [Move((k & 63, k >> 6), ()) for k in range(64 * 64)]
+
+# Switch for move generation: bitboards (mad100_bitboard) or scanning the list of 52 char
+BITBOARD = True     ### *** set ON/OFF *** ###
+
+MOVETABLE_MB = 32           # memory budget of the moveTable in megabytes
+moveTableStats = [0, 0]     # probes and hits of the moveTable (see mad100_stats)
+
+
+###############################################################################
+# moveTable: cache of the legal moves of positions
+###############################################################################
+
+# The legal moves of a position are packed in an array of 64-bit words, one word per move:
+#   from 6 bits | to 6 bits | bitmask of the taken squares (bits 1-50) << 12
+# A capture of n pieces has n-1 intermediate landing squares; they follow in the next
+# words, 10 squares of 6 bits per word. The cache is keyed by the Zobrist key of the
+# position and bounded by a budget in bytes: when it is full, entries are evicted in
+# CLOCK order (second chance: an entry used since the hand passed it stays).
+
+# Python 2 has no array typecode 'Q': if a C long has 32 bits (Windows, 32-bit Linux) the words
+# are kept in a plain list of ints, which takes more memory per word.
+if array('L').itemsize >= 8:
+   WORD_BYTES = 8
+   def new_words(): return array('L')
+else:
+   WORD_BYTES = 40          # estimate: list slot and long object
+   new_words = list
+ENTRY_BYTES = 160           # estimate of the memory of an entry without its words (key, index, slot)
+
+def pack_moves(moves):
+   # Returns array of the packed moves
+   words = new_words()
+   for m in moves:
+      mask = 0
+      for k in m.takes: mask |= 1 << k
+      words.append(m.steps[0] | m.steps[-1] << 6 | mask << 12)
+      via = m.steps[1:-1]
+      for n in range(0, len(via), 10):
+         w = 0
+         for k, i in enumerate(via[n:n+10]): w |= i << 6 * k
+         words.append(w)
+   return words
+
+def unpack_moves(words):
+   # Returns list of the moves of an array of packed moves
+   moves = []
+   n, nwords = 0, len(words)
+   while n < nwords:
+      w = words[n]
+      n += 1
+      mask = w >> 12
+      if not mask:
+         moves.append(QUIET_MOVES[w])
+         continue
+      move = _moves.get(w)
+      if move is not None:
+         moves.append(move)
+         continue
+      takes = []
+      while mask:
+         low = mask & -mask
+         takes.append(low.bit_length() - 1)
+         mask ^= low
+      steps = [w & 63]
+      for k in range(len(takes) - 1):
+         if k % 10 == 0:
+            v = words[n]
+            n += 1
+         steps.append(v >> 6 * (k % 10) & 63)
+      steps.append(w >> 6 & 63)
+      move = Move(tuple(steps), tuple(takes))
+      if len(takes) == 1: _moves[w] = move     # a word without intermediate squares
+      moves.append(move)
+   return moves
+
+_moves = {}     # Move of each word of a capture of one piece; the moves are shared
+
+
+class MoveCache:
+   # CLOCK cache of packed move lists (arrays) with a memory budget of size_mb megabytes.
+   # The entries are in slots; the hand of the clock walks over the slots to find an
+   # entry to evict, clearing the reference bits of the entries it passes.
+
+   def __init__(self, size_mb):
+      self.budget = size_mb * (1 << 20)
+      self.clear()
+
+   def clear(self):
+      self.index = {}          # key -> slot
+      self.keys = []           # key of the entry in each slot or None (free slot)
+      self.words = []          # packed moves of the entry in each slot
+      self.ref = bytearray()   # reference bits
+      self.free = []           # free slots
+      self.hand = 0
+      self.used = 0            # bytes
+      self.evictions = 0
+
+   def __len__(self):
+      return len(self.index)
+
+   def get(self, key):
+      # Returns the packed moves of key or None
+      slot = self.index.get(key)
+      if slot is None: return None
+      self.ref[slot] = 1
+      return self.words[slot]
+
+   def put(self, key, words):
+      size = ENTRY_BYTES + WORD_BYTES * len(words)
+      while self.used + size > self.budget and self.index:
+         slot = self.hand
+         self.hand = (slot + 1) % len(self.keys)
+         if self.keys[slot] is None: continue
+         if self.ref[slot]:
+            self.ref[slot] = 0      # second chance
+            continue
+         self.evict(slot)
+      if self.free:
+         slot = self.free.pop()
+         self.keys[slot], self.words[slot], self.ref[slot] = key, words, 0
+      else:
+         slot = len(self.keys)
+         self.keys.append(key)
+         self.words.append(words)
+         self.ref.append(0)
+      self.index[key] = slot
+      self.used += size
+
+   def evict(self, slot):
+      words = self.words[slot]
+      del self.index[self.keys[slot]]
+      self.used -= ENTRY_BYTES + WORD_BYTES * len(words)
+      self.keys[slot] = self.words[slot] = None
+      self.free.append(slot)
+      self.evictions += 1
 
-moveTable = OrderedDict()   # dict to remember legal moves of a position for better performance
-MOVETABLE_SIZE = 1000000
+# end class MoveCache
+
+moveTable = MoveCache(MOVETABLE_MB)   # legal moves of positions for better performance
 
 
 def bmoves_from_square(board, i):
@@ -99,7 +248,7 @@ def bmoves_from_square(board, i):
          if q == '0': continue       # direction empty; try next direction
          if q == '.' and (d[i] == NE[i] or d[i] == NW[i]):
             # move detected; save and continue
-            moves.append(Move([ i, d[i] ], []))
+            moves.append(QUIET_MOVES[i | d[i] << 6])
 
    if p == 'K':
       for d in directions:
@@ -111,7 +260,7 @@ def bmoves_from_square(board, i):
             if q == '.':
                # move detected; save and continue
                # BUG 21-03-2018: in next statement is d[i] replaced by j
-               moves.append(Move([ i, j ], []))
+               moves.append(QUIET_MOVES[i | j << 6])
 
    return moves
 # end bmoves_from_square ======================================
@@ -134,7 +283,7 @@ def bcaptures_from_square(board, i):
             if r == '0': continue         # no second diagonal square; try next direction
             if r == '.':
                # capture detected; save and continue
-               captures.append(Move([ i, d[d[i]] ], [ d[i] ]))
+               captures.append(Move((i, d[d[i]]), (d[i],)))
 
    if p == 'K':
       for d in directions:
@@ -150,7 +299,7 @@ def bcaptures_from_square(board, i):
             if q.islower() and take != None: break 
             if q == '.' and take != None:
                # capture detected; save and continue
-               captures.append(Move([i,j], [take]))
+               captures.append(Move((i, j), (take,)))
 
    return captures
 # end bcaptures_from_square ======================================
@@ -181,73 +330,111 @@ def basicMoves(board):
 # end basicMoves
 
 
-def searchCaptures(board):
-   # Capture construction by extending incomplete captures with basic captures
-
-   def boundCaptures(board, capture, depth ):
-      # Recursive construction of captures.
-      # - board: current board during capture construction
-      # - capture: incomplete capture used to extend with basic captures
-      # - depth: not used
-      bcaptures = bcaptures_from_square(board, capture.steps[-1])   # new extends of capture
-
+def bitboardMoves(bb):
+   # Return list of basic moves of bitboards; either captures or normal moves
+   # Same result as basicMoves but computed with a few integer operations.
+   bcaptures = mad100_bitboard.captures(bb)
+   if len(bcaptures) > 0:
+      return [Move((i, j), (k,)) for i, j, k in bcaptures]
+   return [QUIET_MOVES[i | j << 6] for i, j in mad100_bitboard.moves(bb)]
+
+# end bitboardMoves
+
+
+def searchCaptures(board, bmoves=None):
+   # Returns list of all maximal captures of board.
+   # Depth-first search on one scratch board, without globals (reentrant):
+   # - The capturing piece is moved on the scratch board and moved back (undo) after each step.
+   # - Taken pieces stay on the board until the capture is complete, so they block the way.
+   #   They are marked with '#', so they cannot be taken twice.
+   # - Only captures with the maximum number of takes are kept. Identical captures
+   #   (same from, to and taken pieces, but another route) are kept once.
+   # - A piece is skipped if it cannot reach the maximum number of takes found so far.
+   # Parameter bmoves: the one-take captures of board (basic moves)
+   if bmoves is None: bmoves = basicMoves(board)
+
+   scratch = list(board)     # the only copy of the board
+   steps, takes = [], []     # capture under construction
+   captures = []             # result list of captures
+   seen = set()              # (from, to, takes) of the captures in the result list
+   max_takes = [0]           # max number of taken pieces (list: changed by nested function)
+
+   def boundCaptures(i, p):
+      # Recursive extension of the capture with the piece p on square i
       completed = True
-      for bcapture in bcaptures: 
-         if len(bcapture.takes) == 0: continue         # no capture; nothing to extend
-         if bcapture.takes[0] in capture.takes: continue      # do not capture the same piece
-
-         n_from = bcapture.steps[0]
-         n_to = bcapture.steps[-1]     # last step
-
-         new_board = list(board)   # clone the board and do the capture without taking pieces
-         new_board[n_from] = '.'
-         new_board[n_to] = board[n_from]
-
-         new_capture = Move(list(capture.steps), list(capture.takes))  # make copy of capture and extend it
-
-         new_capture.steps.append(bcapture.steps[1])
-         new_capture.takes.append(bcapture.takes[0])
-
-         completed = False
-         result = boundCaptures(new_board, new_capture, depth + 1)   # RECURSION
-
-      if completed:
-         # Update global variables
-         global captures
-         captures.append(capture)
-         global max_takes
-         max_takes = len(capture.takes) if len(capture.takes) > max_takes else max_takes
-
-      return 0
+      for dn, d in enumerate(directions):
+         if p == 'P':
+            j = d[i]
+            if j == 0 or not scratch[j].islower() or scratch[d[j]] != '.': continue
+            jumps = [(j, d[j])]
+         else:
+            jumps = []
+            take = 0
+            for j in RAYS[dn][i]:
+               q = scratch[j]
+               if take == 0:
+                  if q == '.': continue
+                  if not q.islower(): break     # own piece or taken piece on this diagonal
+                  take = j
+               elif q == '.':
+                  jumps.append((take, j))
+               else:
+                  break
+
+         for take, j in jumps:
+            q = scratch[take]
+            scratch[take], scratch[i], scratch[j] = '#', '.', p    # do capture step
+            steps.append(j)
+            takes.append(take)
+            boundCaptures(j, p)      # RECURSION
+            steps.pop()
+            takes.pop()
+            scratch[j], scratch[i], scratch[take] = '.', p, q      # undo capture step
+            completed = False
+
+      if completed and len(takes) >= max_takes[0]:
+         if len(takes) > max_takes[0]:
+            max_takes[0] = len(takes)
+            del captures[:]
+            seen.clear()
+         key = (steps[0], steps[-1], tuple(sorted(takes)))
+         if key not in seen:
+            seen.add(key)
+            captures.append(Move(tuple(steps), tuple(takes)))
    # end boundCaptures
 
    # ============================================================================
-   global captures; captures = []       # result list of captures
-   global max_takes; max_takes = 0       # max number of taken pieces
-
-   depth = 0
-   bmoves = basicMoves(board)
-
+   # Pieces that can capture, with an upper bound of the number of takes: a king can take
+   # all opponent pieces off the edge, a man only those on rows of the other parity.
+   roots = []
    for bmove in bmoves:
       if len(bmove.takes) == 0: break    # only moves, no captures; nothing to extend
-      n_from = bmove.steps[0]
-      n_to = bmove.steps[-1]     # last step
-
-      new_board = list(board)      # clone the board and do the capture without taking pieces
-      new_board[n_from] = '.'
-      new_board[n_to] = board[n_from]
-      result = boundCaptures(new_board, bmove, depth)
+      if bmove.steps[0] not in roots: roots.append(bmove.steps[0])
+
+   if len(roots) > 1:
+      count = [0, 0]      # opponent pieces off the edge on even and odd rows
+      for q in INNER:
+         if board[q].islower(): count[ROW[q] % 2] += 1
+      bounds = [(count[0] + count[1] if board[i] == 'K' else count[1 - ROW[i] % 2], i) for i in roots]
+      bounds.sort(reverse=True)
+   else:
+      bounds = [(0, i) for i in roots]
 
-   ##print("Max takes: " + str(max_takes))
+   for bound, i in bounds:
+      if bound < max_takes[0]: continue     # this piece cannot reach the max number of takes
+      steps.append(i)
+      boundCaptures(i, board[i])
+      steps.pop()
 
-   result = [cap for cap in captures if len(cap.takes) == max_takes]
-   return result
+   ##print("Max takes: " + str(max_takes[0]))
+   return captures
 
 # end searchCaptures
 
 
 def hasCapture(pos):     # PUBLIC
    # Returns True if capture for white found for position else False.
+   if BITBOARD: return mad100_bitboard.has_capture(pos.bitboards())
    for i, p in enumerate(pos.board):
       if not p.isupper(): continue
       bcaptures = bcaptures_from_square(pos.board, i)
@@ -256,27 +443,96 @@ def hasCapture(pos):     # PUBLIC
 # end hasCapture
 
 
+def generate(pos):       # PUBLIC
+   # Returns list of all legal moves of a board for player white without using the moveTable.
+   # Used by gen_moves and for measuring the speed of move generation (perft).
+   if BITBOARD:
+      bmoves = bitboardMoves(pos.bitboards())
+      if len(bmoves) > 0 and len(bmoves[0].takes) > 0:
+         return searchCaptures(pos.board, bmoves)
+      return bmoves
+   if hasCapture(pos):
+      return searchCaptures(pos.board)
+   return basicMoves(pos.board)
+# end generate
+
+
 def gen_moves(pos):       # PUBLIC
    # Returns list of all legal moves of a board for player white (capital letters).
-   # Move is a named tuple with array of steps and array of takes
+   # Move is a named tuple with tuple of steps and tuple of takes.
+   # Every call returns a new list; compare moves with ==.
    #
-   entry = moveTable.get(pos.key())
-   if entry is not None: return entry 
-
-   if hasCapture(pos):
-      legalMoves = searchCaptures(pos.board)
+   poskey = pos.key()      # Zobrist key
+   words = moveTable.get(poskey)
+   moveTableStats[0] += 1
+   if words is not None:
+      moveTableStats[1] += 1
    else:
-      legalMoves = basicMoves(pos.board)
-
-   moveTable[pos.key()] = legalMoves
-   if len(moveTable) > MOVETABLE_SIZE:
-      clearTable()
-      ## moveTable.popitem()    # popitem removes and returns an arbitrary (key,value) pair
+      words = pack_moves(generate(pos))
+      moveTable.put(poskey, words)
 
-   return legalMoves
+   return unpack_moves(words)      # the same moves (takes in square order) on every call
 # end gen_moves ============================================
 
 
+def gen_staged(pos, hcode=0, capture=None, order=None, ply=0):       # PUBLIC
+   # Generator of the legal moves in stages, so the search can stop generating after a cut off.
+   # 1. the hash move (move code hcode of the transposition table)
+   # 2. captures, already maximal; if there is a capture, no other move is legal
+   # 3. quiet moves: only generated when the earlier stages did not cut
+   # Within stage 2 moves are sorted by the increment of the score. Stage 3 is sorted by
+   # the killer moves and history of order (see mad100_order) or else by the increment of the score.
+   # Parameter capture: capture availability if already known by the caller.
+   # Parameter ply: distance to the root, for the killer moves.
+   if capture is None: capture = hasCapture(pos)
+
+   if capture:
+      legalMoves = gen_moves(pos)
+      hmove = code_move(pos, hcode)
+      if hmove is not None: yield hmove
+      for move in sorted(legalMoves, key=pos.eval_move, reverse=True):
+         if move != hmove: yield move
+      return
+
+   hmove = None
+   i, j = hcode & 63, (hcode >> 6) & 63
+   if hcode and mad100_bitboard.is_move(pos.bitboards(), i, j):
+      hmove = QUIET_MOVES[hcode & 4095]
+      yield hmove
+
+   if BITBOARD:
+      quietMoves = [QUIET_MOVES[i | j << 6] for i, j in mad100_bitboard.moves(pos.bitboards())]
+   else:
+      quietMoves = basicMoves(pos.board)
+   key = pos.eval_move if order is None else order.quiet_key(pos, ply)
+   for move in sorted(quietMoves, key=key, reverse=True):
+      if move != hmove: yield move
+# end gen_staged ============================================
+
+
+def move_code(pos, move):     # PUBLIC
+   # Returns code of a legal move for the transposition table: from + 64*to + 4096*n.
+   # Captures with the same from and to can differ in the taken pieces: n is the number
+   # of earlier moves in gen_moves(pos) with the same from and to. Returns 0 if n > 3.
+   i, j = move.steps[0], move.steps[-1]
+   n = 0
+   if len(move.takes) > 0:
+      for m in gen_moves(pos):
+         if m == move: break
+         if m.steps[0] == i and m.steps[-1] == j: n += 1
+   return i | j << 6 | n << 12 if n < 4 else 0
+
+def code_move(pos, code):     # PUBLIC
+   # Returns the legal move of a move code or None
+   if not code: return None
+   i, j, n = code & 63, (code >> 6) & 63, code >> 12
+   for m in gen_moves(pos):
+      if m.steps[0] == i and m.steps[-1] == j:
+         if n == 0: return m
+         n -= 1
+   return None
+
+
 def isLegal(pos, move):     # PUBLIC
    # Returns True if move for position is legal else False.
    if move in gen_moves(pos):
@@ -292,7 +548,10 @@ def clearMoveTable():        # PUBLIC
 
 
 def moveTableSize():     # PUBLIC
-   print('moveTable entries: ' + str(len(moveTable)))
+   probes, hits = moveTableStats
+   print('moveTable entries: %d  memory: %.1f of %.0f MB  evictions: %d  probes: %d  hits: %d (%.1f%%)' %
+         (len(moveTable), moveTable.used / float(1 << 20), moveTable.budget / float(1 << 20), moveTable.evictions,
+          probes, hits, 100.0 * hits / probes if probes > 0 else 0.0))
 
 
 # *********************************************************************************
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Move ordering: killer moves and history heuristic
+#=====================================================================
+
+# Used by the staged move generation (mad100_moves.gen_staged) of the three searches.
+# Order of the moves of a node:
+# 1. the move of the transposition table (hash move)
+# 2. captures (if there is a capture, only captures are legal)
+# 3. quiet moves: promotions, two killer moves of the ply, then by history score
+#    and at last by the increment of the score (eval_move)
+#
+# Killer moves: quiet moves that caused a cut off at the same ply in another node.
+# History: for each (from, to) the sum of depth*depth of all cut offs of that move
+# (butterfly table). The history is halved between iterations (aging), so recent
+# results count more.
+
+MAX_PLY = 128
+
+
+class MoveOrder:
+   # Killer moves, history table and statistics of the cut offs
+
+   def __init__(self):
+      self.new_search()
+
+   def new_search(self):
+      # Clear killers, history and statistics
+      self.killers = [[None, None] for ply in range(MAX_PLY)]    # (from, to) of two quiet moves
+      self.history = [0] * (51 * 51)                             # index: from * 51 + to
+      self.cuts = 0             # number of nodes with a cut off
+      self.first_cuts = 0       # number of nodes with a cut off by the first move
+
+   def age(self):
+      # Halve the history scores; called between iterations
+      history = self.history
+      for i in range(len(history)):
+         if history[i]: history[i] >>= 1
+
+   def quiet_key(self, pos, ply):
+      # Returns sort key for the quiet moves of pos at ply (highest first)
+      k1, k2 = self.killers[ply] if ply < MAX_PLY else (None, None)
+      history, board = self.history, pos.board
+      def key(move):
+         i, j = move.steps[0], move.steps[-1]
+         promotion = 1 if j <= 5 and board[i] == 'P' else 0
+         killer = 2 if (i, j) == k1 else 1 if (i, j) == k2 else 0
+         return (promotion, killer, history[i * 51 + j], pos.eval_move(move))
+      return key
+
+   def cutoff(self, move, ply, depth, nmoves):
+      # Register a cut off by move; nmoves is the number of moves searched at the node
+      self.cuts += 1
+      if nmoves == 1: self.first_cuts += 1
+      if len(move.takes) > 0 or depth <= 0: return     # only quiet moves of the main search
+      i, j = move.steps[0], move.steps[-1]
+      if ply < MAX_PLY:
+         killers = self.killers[ply]
+         if killers[0] != (i, j):
+            killers[1] = killers[0]
+            killers[0] = (i, j)
+      self.history[i * 51 + j] += depth * depth
+
+   def report(self):
+      # Returns string with statistics of the cut offs
+      rate = 100.0 * self.first_cuts / self.cuts if self.cuts > 0 else 0.0
+      return 'cut nodes: %d  first move cuts: %d (%.1f%%)' % (self.cuts, self.first_cuts, rate)
+
+# end class MoveOrder
+
+
+# *********************************************************************************
+def main():
+   print('nothing to do')
+   return 0
+
+if __name__ == '__main__':
+    main()
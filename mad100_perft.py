@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Perft: count the leaf nodes of the move tree up to a fixed depth.
+# Used to check the correctness and to measure the speed of move generation.
+#=====================================================================
+
+from __future__ import print_function
+from __future__ import division
+import os.path
+import sys
+import time
+from multiprocessing import Pool
+import mad100
+from mad100_moves import generate
+from mad100_play import mrender_move, parseFEN
+
+PERFT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'perft_reference')
+
+def perft(pos, depth, table=None):
+   # Returns number of leaf nodes of the move tree of pos with given depth.
+   # - pos: a SearchPosition; moves are done and undone in place
+   # - table: dict for hashed perft (key of (position, depth) -> count) or None
+   # Move generation is done without the moveTable of mad100_moves.
+   if depth == 0: return 1
+   if table is not None:
+      count = table.get((pos.zkey, depth))
+      if count is not None: return count
+
+   moves = generate(pos)
+   if depth == 1:
+      count = len(moves)
+   else:
+      count = 0
+      for move in moves:
+         undo = pos.make(move)
+         count += perft(pos, depth - 1, table)
+         pos.unmake(move, undo)
+
+   if table is not None:
+      table[(pos.zkey, depth)] = count
+   return count
+
+def _perft_move(args):
+   # Worker of the process pool: perft of the position after one root move
+   pos, i, depth, hashed = args
+   spos = mad100.SearchPosition(pos)
+   move = generate(spos)[i]
+   spos.make(move)
+   return perft(spos, depth - 1, {} if hashed else None)
+
+def divide(pos, depth, hashed=False, processes=1):
+   # Returns list of (move, count) for all root moves of pos.
+   # - hashed: use a transposition cache
+   # - processes: number of processes; the root moves are divided over a pool
+   spos = mad100.SearchPosition(pos)
+   moves = generate(spos)
+   if depth < 1: return []
+
+   if processes > 1:
+      pool = Pool(processes)
+      try:
+         counts = pool.map(_perft_move, [(pos, i, depth, hashed) for i in range(len(moves))])
+      finally:
+         pool.close()
+         pool.join()
+      return list(zip(moves, counts))
+
+   table = {} if hashed else None
+   res = []
+   for move in moves:
+      undo = spos.make(move)
+      res.append((move, perft(spos, depth - 1, table)))
+      spos.unmake(move, undo)
+   return res
+
+def run_perft(pos, depth, hashed=False, processes=1):
+   # Returns (nodes, seconds) of perft of pos
+   start = time.time()
+   if processes > 1:
+      nodes = sum(count for move, count in divide(pos, depth, hashed, processes))
+   else:
+      nodes = perft(mad100.SearchPosition(pos), depth, {} if hashed else None)
+   return nodes, time.time() - start
+
+def report(depth, nodes, secs):
+   # Print result line of perft
+   nps = nodes / secs if secs > 0 else 0
+   print('perft %2d  nodes: %10d  time: %8.3f  nodes/s: %10.0f' % (depth, nodes, secs, nps))
+
+def print_divide(color, pos, depth, hashed=False, processes=1):
+   # Print count of all root moves and the total
+   start = time.time()
+   res = divide(pos, depth, hashed, processes)
+   secs = time.time() - start
+   for move, count in res:
+      print('%8s %10d' % (mrender_move(color, move), count))
+   report(depth, sum(count for move, count in res), secs)
+
+###############################################################################
+# Reference counts
+###############################################################################
+
+def read_reference(f=PERFT_FILE):
+   # Returns list of (name, fen, depth, nodes) of the reference file.
+   # Each line: name depth nodes fen; lines starting with # are comments.
+   res = []
+   for line in open(f, 'r'):
+      line = line.strip()
+      if line == '' or line.startswith('#'): continue
+      name, depth, nodes, fen = line.split(None, 3)
+      res.append((name, fen, int(depth), int(nodes)))
+   return res
+
+def check_reference(f=PERFT_FILE, maxdepth=99, hashed=False, processes=1):
+   # Run perft for all reference positions and compare the counts.
+   # Returns number of failures.
+   failures = 0
+   total_nodes, total_secs = 0, 0.0
+   for name, fen, depth, expected in read_reference(f):
+      if depth > maxdepth: continue
+      nodes, secs = run_perft(parseFEN(fen), depth, hashed, processes)
+      total_nodes += nodes
+      total_secs += secs
+      status = 'ok' if nodes == expected else 'FAILED (expected %d)' % expected
+      if nodes != expected: failures += 1
+      print('%-14s depth %2d  nodes: %10d  time: %8.3f  %s' % (name, depth, nodes, secs, status))
+   print('Total nodes: %d  time: %.3f  nodes/s: %.0f  failures: %d' % (
+         total_nodes, total_secs, total_nodes / total_secs if total_secs > 0 else 0, failures))
+   return failures
+
+
+###############################################################################
+def main():
+   # Check move generation against the reference counts
+   maxdepth = int(sys.argv[1]) if len(sys.argv) > 1 else 99
+   return 1 if check_reference(maxdepth=maxdepth) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
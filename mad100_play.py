@@ -66,8 +66,8 @@ def parseFEN(iFen):
 def mrender_move(color, move):
     # Render move in numeric format (mutual version)
     if move is None: return ''
-    steps = move.steps if color == WHITE else map(lambda i: 51-i, move.steps)
-    takes = move.takes if color == WHITE else map(lambda i: 51-i, move.takes)
+    steps = move.steps if color == WHITE else tuple(51-i for i in move.steps)
+    takes = move.takes if color == WHITE else tuple(51-i for i in move.takes)
     rmove = Move(steps, takes)
     return mad100.render_move(rmove)
 
@@ -10,9 +10,15 @@ from __future__ import division
 import re
 import sys
 import time
+from multiprocessing import cpu_count
 from mad100 import initial_ext, initial_ext_test, board_ext_problem1, newPos, match_move
 from mad100_moves import gen_moves, clearMoveTable, isLegal, moveTableSize
 import mad100_search
+import mad100_perft
+import mad100_bench
+import mad100_egtb
+from mad100_time import TimeControl
+from mad100_hub import Searcher
 from mad100_play import mprint_pos, mparse_move, mrender_move, render_pv, parseFEN
 
 # Python 2 compatability
@@ -31,6 +37,11 @@ def main():
     stack.append('nodes 1000')   # initial level
     ptr = -1                     # move pointer
     pv_list = []
+    tc = None                    # time control; None: search with max nodes
+    processes = 1                # processes of the MTD-bi search (Lazy SMP if more than one)
+    pondering = False            # ponder mode: search the expected reply during the time of the opponent
+    ponder = Searcher()          # background search of the ponder position (see mad100_hub)
+    ponder_move, ponder_hit = None, None    # expected reply; time of the ponder hit
 
     while True:
         if stack:
@@ -38,6 +49,12 @@ def main():
         else:
             comm = input('Command: ' )
 
+        if ponder.busy() and not (comm.startswith('m') or comm in ('legal', 'eval', 'stats')):
+            # Any other command ends the pondering; the transposition table stays filled
+            ponder.stop()
+            ponder.wait()
+            ponder_move, ponder_hit = None, None
+
         if comm.startswith('q'):  # quit
             break
 
@@ -55,8 +72,34 @@ def main():
             elif len(comm.split()) == 2:
                level = int(comm.split()[1])
                max_nodes = int(level)
+            tc = None
             print('   Level max nodes: %d' %(max_nodes) )
 
+        elif comm.startswith('time'):
+            # Set fixed time per move in seconds
+            if len(comm.split()) != 2: continue
+            tc = TimeControl(movetime=float(comm.split()[1]))
+            print('   Level %s' %(tc) )
+
+        elif comm == 'stats':
+            # Statistics of the last search
+            print(mad100_search.stats.report())
+
+        elif comm.startswith('smp'):
+            # Set number of processes of the MTD-bi search (or all cores)
+            args = comm.split()
+            processes = int(args[1]) if len(args) == 2 else cpu_count()
+            print('   Search processes: %d' %(processes) )
+
+        elif comm.startswith('clock'):
+            # Set game clock: clock <seconds> [<increment> [<moves to go>]]
+            args = comm.split()
+            if len(args) < 2 or len(args) > 4: continue
+            inc = float(args[2]) if len(args) > 2 else 0.0
+            movestogo = int(args[3]) if len(args) > 3 else None
+            tc = TimeControl(clock=float(args[1]), inc=inc, movestogo=movestogo)
+            print('   Level %s' %(tc) )
+
         elif comm.startswith('new'):
             # Setup new position
             b = 0  # TEST different positions
@@ -92,7 +135,7 @@ def main():
                # search for next move
                origc = color
                start = time.time()
-               move, score = mad100_search.search(pos, maxn=max_nodes)
+               move, score = mad100_search.search(pos, maxn=max_nodes, tc=tc, processes=processes)
                finish = time.time()
                print("Time elapsed: ", str(finish - start))
 
@@ -106,7 +149,7 @@ def main():
                   # *** search for forced combinations ***
                   origc = color
                   start = time.time()
-                  move, score = mad100_search.search_pvf(pos, max_nodes)
+                  move, score = mad100_search.search_pvf(pos, max_nodes, tc=tc)
                   finish = time.time()
                   print("Time elapsed: ", str(finish - start))
 
@@ -118,7 +161,7 @@ def main():
                   # search with normal alpha-beta for next move
                   origc = color
                   start = time.time()
-                  move, score = mad100_search.search_ab(pos, maxn=max_nodes)
+                  move, score = mad100_search.search_ab(pos, maxn=max_nodes, tc=tc)
                   finish = time.time()
                   print("Time elapsed: ", str(finish - start))
 
@@ -134,6 +177,30 @@ def main():
                print('Best move:', mrender_move(color, move))
 
 
+        elif comm.startswith('ponder'):
+            # ponder on|off: search the expected reply while the opponent thinks
+            args = comm.split()
+            pondering = len(args) == 1 or args[1] == 'on'
+            print('   Pondering: %s' %('on' if pondering else 'off') )
+
+        elif comm.startswith('perft'):
+            # perft <depth> [divide] [hash] [par]: count leaf nodes of the move tree
+            # perft test [<maxdepth>]: compare with the reference counts
+            args = comm.split()
+            if len(args) < 2: continue
+            if args[1] == 'test':
+               maxdepth = int(args[2]) if len(args) == 3 else 99
+               mad100_perft.check_reference(maxdepth=maxdepth)
+               continue
+            depth = int(args[1])
+            hashed = 'hash' in args
+            pprocs = cpu_count() if 'par' in args else 1
+            if 'divide' in args:
+               mad100_perft.print_divide(color, pos, depth, hashed, pprocs)
+            else:
+               nodes, secs = mad100_perft.run_perft(pos, depth, hashed, pprocs)
+               mad100_perft.report(depth, nodes, secs)
+
         elif comm.startswith('p'):
             if len(comm.split()) == 1:
                stack.append('p >')    # do next move in PV
@@ -185,9 +252,20 @@ def main():
         elif comm.startswith('m'):
             if len(comm.split()) == 1:
                start = time.time()
-               move, score = mad100_search.search(pos, maxn=max_nodes)
+               if ponder_hit is not None:
+                  # Ponder hit: the result of the search that started on the expected move
+                  move, score = ponder.wait()[:2]
+                  start = ponder_hit
+                  ponder_move, ponder_hit = None, None
+               else:
+                  if ponder.busy():       # the opponent did not move: no use of the ponder search
+                     ponder.stop()
+                     ponder.wait()
+                     ponder_move = None
+                  move, score = mad100_search.search(pos, maxn=max_nodes, tc=tc, processes=processes)
                finish = time.time()
                print("Time elapsed: ", str(finish - start))
+               if tc is not None: tc.used(finish - start)    # game clock
 
                if move is None:
                   print('no move found', ' score: ', score)
@@ -196,10 +274,19 @@ def main():
                else:
                   print('Principal Variation: %s' % (render_pv(color, pos, mad100_search.tp)))
                   print('Move done:', mrender_move(color, move))
+                  pv = [entry.move for entry in mad100_search.gen_pv(pos, mad100_search.tp)]
                   pos = pos.domove(move)
                   color = 1-color      # alternating 0 and 1 (WHITE and BLACK)
                   mprint_pos(color, pos)
 
+                  if pondering and len(pv) > 1 and pv[0] == move and pv[1] in gen_moves(pos):
+                     # Search the position after the expected reply (second move of the PV)
+                     ponder_move = pv[1]
+                     limits = {'maxn': max_nodes} if tc is None else \
+                              {'movetime': tc.movetime, 'clock': tc.clock, 'inc': tc.inc, 'movestogo': tc.movestogo}
+                     ponder.start(pos.domove(ponder_move), ponder=True, **limits)
+                     print('Pondering on', mrender_move(color, ponder_move))
+
             elif len(comm.split()) == 2:
                _, smove = comm.split()
                smove = smove.strip()
@@ -210,6 +297,16 @@ def main():
 
                   if lmove in gen_moves(pos):
                      ###print('MOVE: ', lmove)
+                     if ponder.busy():
+                        if lmove == ponder_move:
+                           print('Ponder hit')
+                           ponder.hit()
+                           ponder_hit = time.time()
+                        else:
+                           print('Ponder miss')
+                           ponder.stop()
+                           ponder.wait()
+                           ponder_move, ponder_hit = None, None
                      pos = pos.domove(lmove)
                      color = 1-color      # alternating 0 and 1 (WHITE and BLACK)
                      mprint_pos(color, pos)
@@ -219,14 +316,31 @@ def main():
                   # Inform the user when invalid input is entered
                   print("Please enter a move like 32-28 or 26x37")
 
+        elif comm.startswith('bench'):
+            # bench [<nodes>]: search a fixed suite of positions with all search methods
+            args = comm.split()
+            maxn = int(args[1]) if len(args) == 2 else mad100_bench.BENCH_NODES
+            print(mad100_bench.report(mad100_bench.run_bench(maxn)))
+
         elif comm.startswith('book'):
             # *** init opening book ***
             start = time.time()
             #mad100_search.book_readFile('data/openbook_test15')
-            mad100_search.book_readFile('data/mad100_openbook')
+            if comm.split()[-1] == 'text':
+               mad100_search.book_readFile('data/mad100_openbook')
+            elif len(comm.split()) == 2:
+               mad100_search.book_openBinary(comm.split()[1])    # for example a book of mad100_bookbuild
+            else:
+               mad100_search.book_openBinary('data/mad100_openbook.bin', 'data/mad100_openbook')
             finish = time.time()
             print("Time elapsed: ", str(finish - start))
 
+        elif comm.startswith('egtb'):
+            # *** open endgame tablebases ***
+            args = comm.split()
+            count = mad100_egtb.load(args[1]) if len(args) == 2 else mad100_egtb.load()
+            print('Endgame tablebases: %d tables  complete up to %d pieces' % (count, mad100_egtb.max_pieces))
+
         elif comm.upper().startswith('H') or comm.startswith('?'):
             print(' _________________________________________________________________  ')
             print('| Use one of these commands:  ')
@@ -238,6 +352,10 @@ def main():
             print('| eval:        print score of position  ')
             print('| legal:       show legal moves  ')
             print('| nodes <num>: set max number of nodes for search (or default)  ')
+            print('| time <sec>:  set fixed time per move  ')
+            print('| clock <sec> [<inc> [<moves>]]: set game clock with increment and moves to go  ')
+            print('| smp <num>:   set number of processes for parallel search (or all cores)  ')
+            print('| ponder on|off: search the expected reply during the time of the opponent  ')
             print('|  ')
             print('| m       : let computer search and play a move  ')
             print('| m <move>: do move (format: 32-28, 16x27, etc)  ')
@@ -251,8 +369,20 @@ def main():
             print('|   go    : method 1 > MTD-bi  ')
             print('|   go f  : method 2 > forced variation  ')
             print('|   go ab : method 3 > alpha-beta search  ')
+            print('| stats: statistics of the last search  ')
+            print('|  ')
+            print('| book: init opening book (binary; compiled if not present)  ')
+            print('|   book text : read text opening book  ')
+            print('|   book <file>: open binary opening book file  ')
+            print('|  ')
+            print('| egtb [<dir>]: open endgame tablebases (generate: python mad100_egtb.py)  ')
             print('|  ')
-            print('| book: init opening book  ')
+            print('| perft <depth>: count leaf nodes of move generation  ')
+            print('|   perft <depth> divide : count per move  ')
+            print('|   perft <depth> hash   : with transposition cache  ')
+            print('|   perft <depth> par    : divide root moves over all cores  ')
+            print('|   perft test           : compare with reference counts  ')
+            print('| bench [<nodes>]: speed of the searches on a fixed suite of positions  ')
             print('|_________________________________________________________________  ')
             print()
 
@@ -6,20 +6,34 @@
 # 2. Forced variation: search only for moves that leads to a capture for the opponent.
 # 3. Normal alpha-beta search with aspiration windows
 # Implementation of an opening book.
+# The MTD-bi search can run in parallel (Lazy SMP).
 #######################################################################################
 
 import os.path
 import re
+import time
+import multiprocessing
 from random import randint
 from collections import OrderedDict, namedtuple
-from mad100_moves import gen_moves, hasCapture, Move
+try:
+   from Queue import Empty        # Python 2
+except ImportError:
+   from queue import Empty
+from mad100_moves import gen_moves, gen_staged, hasCapture, move_code, code_move, Move
 from mad100_play import mrender_move, render_pv, mparse_move, mprint_pos
+import mad100_book
+import mad100_egtb
+from mad100_tt import TransTable, LOWER, UPPER, EXACT
+from mad100_order import MoveOrder
+from mad100_time import SearchAbort, POLL_MASK
+from mad100_stats import SearchStats, SearchResult
 import mad100
 
-TABLE_SIZE = 1e6  # constant of maximum number allowed items in transposition table.
+TABLE_SIZE_MB = 16  # size of each transposition table in megabytes.
 
 # The MAX_NODES constant controls how much time we spend on looking for optimal moves.
 # This is the default max number of nodes searched.
+# With a time control (see mad100_time) the node budget is not used.
 #
 MAX_NODES = 1000
 
@@ -30,136 +44,331 @@ MAX_NODES = 1000
 #
 MATE_VALUE = 90000
 
+# Score of a position won according to the endgame tablebases (see mad100_egtb),
+# plus the evaluation so the search still prefers to make progress (captures, promotion).
+#
+TB_WIN = MATE_VALUE // 2
+
+# Search switches; module level, so they can be set per engine (see mad100_match).
+#
+nullswitch = True         # null move heuristic ON/OFF
+NULL_R = 2                # depth reduction of the null move; one more at depth > 8
+valWINDOW = 50            # aspiration window of search_ab: tune for optimal results
+
+# Selective search of bound() (search 'mtd') and alphabeta() (search 'ab'); ON/OFF per search.
+# Quiet moves exclude captures and promotions, and moves that offer the opponent a capture
+# (a sacrifice may be a shot); nodes with a capture are never pruned or reduced.
+# - late move reductions (LMR): a quiet move after the first LMR_MOVES moves of a node is
+#   searched one ply less deep, at depth >= LMR_DEPTH; if it fails high it is searched again
+#   to full depth
+# - futility pruning: at depth 1 and 2 a quiet move is skipped if the score after the move
+#   plus FUTILITY_MARGIN[depth] cannot reach the window
+# - razoring: at depth RAZOR_DEPTH the node returns the evaluation if it is more than
+#   RAZOR_MARGIN below the window
+#
+lmrswitch = {'mtd': True, 'ab': True}            # late move reductions ON/OFF
+futilityswitch = {'mtd': True, 'ab': True}       # futility pruning and razoring ON/OFF
+LMR_DEPTH = 3
+LMR_MOVES = 3
+FUTILITY_MARGIN = (0, 250, 500)      # by depth: a quarter and half a man (PMAT['P'] = 1000)
+RAZOR_DEPTH = 3
+RAZOR_MARGIN = 1000                  # a man
+
+# Quiescence search: at depth <= 0 the searches continue with quiesce() until no capture is left.
+#
+QCACHE_SIZE = 1 << 16     # max entries of the quiescence cache qcache
+
 Entry_pv = namedtuple('Entry_pv', 'pos score move')    # Entry for saving principal variation
 
+order = MoveOrder()       # Move ordering (killer moves, history) shared by the three searches
+timer = None              # TimeControl of the running search or None; polled every POLL_NODES nodes
+search_depth = 0          # depth of the last completed iteration of the last search
+stats = SearchStats()     # statistics of the running or last search (see mad100_stats)
+qcache = {}               # quiescence cache: key -> exact score of a position with a capture
+
+###############################################################################
+# Endgame tablebases
+###############################################################################
+
+def tb_score(pos):
+    # Returns the score of pos according to the endgame tablebases or None if not available
+    bb = pos.bitboards()
+    if mad100_egtb.popcount(bb[0] | bb[1] | bb[2] | bb[3]) > mad100_egtb.max_pieces:
+        return None
+    wdl = mad100_egtb.probe(bb)
+    if wdl is None: return None
+    if wdl == mad100_egtb.WIN: return TB_WIN + pos.score
+    if wdl == mad100_egtb.LOSS: return -TB_WIN + pos.score
+    return 0      # draw
+
+###############################################################################
+# Quiescence search
+###############################################################################
+
+def quiesce(pos, ply):
+    # Capture-only search at the leaves (depth <= 0) of the searches.
+    # Capture is mandatory: a position with a capture is searched further with only the forced
+    # captures of gen_moves (the maximum captures); a position without capture returns its
+    # evaluation (stand pat). The result is the exact score from the side to move; it does
+    # not depend on a window, so it is kept in qcache and not in the transposition tables.
+    # Parameter ply: distance to the root (selective depth).
+    #
+    if not hasCapture(pos):
+       return pos.score    # Evaluate position
+    stats.qnodes += 1
+    if stats.qnodes & POLL_MASK == 0 and timer is not None and timer.poll():
+       raise SearchAbort       # time is up: a capture tree can be large
+    if ply > stats.seldepth: stats.seldepth = ply
+
+    poskey = pos.key()
+    score = qcache.get(poskey)
+    if score is not None:
+       stats.qcache_hits += 1
+       return score
+
+    best = -MATE_VALUE
+    for move in gen_moves(pos):
+       undo = pos.make(move)
+       score = -1 * quiesce(pos, ply+1)    # RECURSION
+       pos.unmake(move, undo)
+       if score > best:
+          best = score
+
+    if len(qcache) >= QCACHE_SIZE: qcache.clear()
+    qcache[poskey] = best
+    return best
+
 ###############################################################################
 # MTD-bi search
 ###############################################################################
 
-Entry_tp = namedtuple('Entry_tp', 'depth score gamma move')
-tp = OrderedDict()                                     # Transposition Table: dict of Entry
+tp = TransTable(TABLE_SIZE_MB, shared=True)            # Transposition Table (see mad100_tt); shared by the processes of Lazy SMP
+
+def quiet_move(pos, move):
+    # True for a move without capture and promotion (see the selective search)
+    return not move.takes and not (move.steps[-1] <= 5 and pos.board[move.steps[0]] == 'P')
 
-def bound(pos, gamma, depth):
+def tp_move(pos, entry):
+    # Returns the move of a transposition table entry; the entry holds the move code
+    if entry is None: return None
+    return code_move(pos, entry.move)
+
+def bound(pos, gamma, depth, ply=0):
     # Alpha-beta pruning with null-window defined by gamma: [alpha, beta] = [gamma-1, gamma]
     # Parameter gamma is a guess of the exact score. It plays a role in a null-window search
     # with window [gamma-1, gamma]. Cut off childs if the real score >= gamma.
+    # Parameter ply: distance to the root (for the killer moves).
     # 
     global nodes; nodes += 1
+    if nodes & POLL_MASK == 0 and timer is not None and timer.poll():
+       raise SearchAbort       # time is up: unwind to search()
+
+    # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
+    if depth <= 0:
+       if mad100_egtb.max_pieces:
+          tscore = tb_score(pos)
+          if tscore is not None:
+             return tscore
+       return quiesce(pos, ply)
 
     # Look in the tranposition table if we have already searched this position before.
     # We use the table value if it was done with at least as deep a search as ours,
-    # and the gamma value is compatible.
+    # and the bound type is compatible with gamma.
     #
-    entry = tp.get(pos.key())    # key() is board string
-    if entry is not None and depth <= entry.depth and (
-          entry.score < entry.gamma and entry.score < gamma or
-          entry.score >= entry.gamma and entry.score >= gamma ):
-       return entry.score      # Stop searching this node
+    poskey = pos.key()          # key() is Zobrist key
+    entry = tp.get(poskey)
+    stats.tt_probes += 1
+    if entry is not None:
+       stats.tt_hits += 1
+       if depth <= entry.depth and (
+             entry.flag == UPPER and entry.score < gamma or
+             entry.flag == LOWER and entry.score >= gamma or entry.flag == EXACT ):
+          stats.tt_cuts += 1
+          return entry.score      # Stop searching this node
+
+    # Exact result of the endgame tablebases (not at the root: we need a move there)
+    if mad100_egtb.max_pieces and ply > 0:
+       tscore = tb_score(pos)
+       if tscore is not None:
+          return tscore
 
     # Stop searching if we have won/lost.
     if abs(pos.score) >= MATE_VALUE:
        return pos.score
 
+    capture = hasCapture(pos)     # capture availability; computed only once for this node
+
+    # RAZORING: far below gamma near the leaves, the quiet moves will not bring us back.
+    futility = futilityswitch['mtd'] and not capture and ply > 0
+    if futility and depth == RAZOR_DEPTH and pos.score + RAZOR_MARGIN < gamma:
+       stats.razor_cuts += 1
+       return pos.score
+
     # NULL MOVE HEURISTIC. For increasing speed.
     # The idea is that you give the opponent a free shot at you. If your position is still so good
     # that you exceed gamma, you assume that you'd also exceed gamma if you went and searched all of your moves.
     # So you simply return gamma without searching any moves.
     #
-    nullswitch = True    ### *** set ON/OFF *** ###
-    R = 3 if depth > 8 else 2              # depth reduction
-    if depth >= 4 and not hasCapture(pos) and nullswitch:
-       child = pos.rotate()    # position of opponent without move of player
-       nullscore = -bound(child, 1-gamma, depth-1-R)     # RECURSION
+    R = NULL_R + 1 if depth > 8 else NULL_R     # depth reduction
+    if depth >= 4 and not capture and nullswitch:
+       stats.null_tries += 1
+       undo = pos.make(None)    # position of opponent without move of player
+       nullscore = -bound(pos, 1-gamma, depth-1-R, ply+1)     # RECURSION
+       pos.unmake(None, undo)
        if nullscore >= gamma:
+          stats.null_cuts += 1
           return nullscore      # Nullscore high: stop searching this node
 
-    # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
-    if depth <= 0 and not hasCapture(pos):
-       return pos.score    # Evaluate position
-
-    # We generate all possible legal moves and order them to provoke cuts.
+    # We generate the legal moves in stages and in order to provoke cuts: the move of the
+    # transposition table first, then captures, killer moves and history (see mad100_order).
+    # Most nodes cut on the first move, so the other moves are often not generated at all.
     # At the next level of the tree we are going to minimize the score.
     # This can be shown equal to maximizing the negative score, with a slightly
     # adjusted gamma value.
     #
     best, bmove = -MATE_VALUE, None
-    moveList = sorted(gen_moves(pos), key=pos.eval_move, reverse=True)
-
-    for move in moveList:
-       # Sort and iterate over the generator returned by gen_moves
-       score = -1 * bound(pos.domove(move), 1-gamma, depth-1)   # RECURSION
+    hcode = 0 if entry is None else entry.move
+
+    futile = futility and depth <= 2                  # FUTILITY PRUNING of quiet moves
+    reduce = lmrswitch['mtd'] and depth >= LMR_DEPTH and not capture and ply > 0    # LMR
+
+    nmoves = 0
+    for move in gen_staged(pos, hcode, capture, order, ply):
+       # Iterate over the staged generator
+       nmoves += 1
+       quiet = (futile or reduce and nmoves > LMR_MOVES) and quiet_move(pos, move)
+       if futile and quiet:
+          estimate = pos.score + pos.eval_move(move) + FUTILITY_MARGIN[depth]
+       undo = pos.make(move)    # the position is changed in place; no new objects
+       if quiet and hasCapture(pos):
+          quiet = False         # the opponent can capture: maybe a shot
+       if futile and quiet and estimate < gamma:
+          pos.unmake(move, undo)
+          stats.futility_prunes += 1
+          best = max(best, estimate)
+          continue
+       if reduce and quiet and nmoves > LMR_MOVES:
+          stats.lmr_reductions += 1
+          score = -1 * bound(pos, 1-gamma, depth-2, ply+1)    # reduced
+          if score >= gamma:
+             stats.lmr_researches += 1
+             score = -1 * bound(pos, 1-gamma, depth-1, ply+1)
+       else:
+          score = -1 * bound(pos, 1-gamma, depth-1, ply+1)   # RECURSION
+       pos.unmake(move, undo)
        if score > best:
           best = score
           bmove = move
        if score >= gamma:   # CUT OFF
+          order.cutoff(move, ply, depth, nmoves)
           break
-
+    if nmoves > 0:
+       stats.expanded += 1
+       stats.moves += nmoves
 
     # UPDATE TRANSPOSITION TABLE
     # We save the found move together with the score, so we can retrieve it in the play loop.
-    # We also trim the transposition table in FILO order.
+    # The score is a lower bound if it is a fail-high, else an upper bound.
     # We prefer fail-high moves, as they are the ones we can build our PV (Principal Variation) from.
     # Depth condition: we prefer an entry with higher depth value.
     #    So replace the already retrieved entry if depth >= entry.depth
     #
     if entry is None or ( depth >= entry.depth and best >= gamma ):
-        tp[pos.key()] = Entry_tp(depth, best, gamma, bmove)   # key() is board string
-        if len(tp) > TABLE_SIZE:
-            tp.popitem()  # popitem removes and returns an arbitrary (key,value) pair
+        flag = LOWER if best >= gamma else UPPER
+        tp.put(poskey, depth, best, flag, 0 if bmove is None else move_code(pos, bmove))
 
     return best
 
-def search(pos, maxn=MAX_NODES):
+def mtd_bi(spos, depth):
+    # One iteration of MTD-bi: a binary search on the score of the position.
+    # Returns the last gamma and the score.
+    #
+    # Inv: lower <= score <= upper
+    # However this may be broken by values from the transposition table,
+    # as they don't have the same concept of p(score). Hence we just use
+    # 'lower < upper - margin' as the loop condition.
+    lower, upper = -MATE_VALUE, MATE_VALUE
+    while lower < upper - 3: 
+        gamma = (lower+upper+1)//2         # bisection !!   gamma === beta
+        score = bound(spos, gamma, depth)   # AlphaBetaWithMemory
+        stats.bisections += 1
+        if score >= gamma:
+            lower = score
+        if score < gamma:
+            upper = score
+    return gamma, score
+
+def search(pos, maxn=MAX_NODES, tc=None, processes=1):
     # Iterative deepening MTD-bi search, the bisection search version of MTD
     # See the term "MTD-f" at wikipedia.
-
+    # The search itself runs on a mutable copy of pos (make/unmake of moves).
+    # Parameter tc: TimeControl (see mad100_time) or None to search with node budget maxn.
+    # Parameter processes: number of processes; more than one is a parallel search (Lazy SMP).
+    #    The node budget counts only the nodes of the main process.
+    # Returns the best move and score of the last completed iteration (the deepest of all processes)
+    # as SearchResult with the statistics of the search.
+    global stats; stats = SearchStats('mtd')
     move = book_searchMove(pos)
+    stats.phase('book', time.time() - stats.t0)
     if move is not None:
        print('Move from opening book')
-       depth, score, gamma, move = 0, pos.score, None, move
-       tp[pos.key()] = Entry_tp(depth, score, gamma, move)
-       if len(tp) > TABLE_SIZE:
-          tp.popitem()  # popitem removes and returns an arbitrary (key,value) pair
-       return move, pos.score
+       tp.put(pos.key(), 0, pos.score, EXACT, move_code(pos, move))
+       stats.finish(0)
+       return SearchResult(move, pos.score, stats)
 
     global nodes; nodes = 0
-    if len(tp) > (TABLE_SIZE // 2):
-       global tp
-       tp.clear()            # empty dict when half full
+    global timer; timer = tc
+    global search_depth; search_depth = 0
+    tp.new_search()          # entries of previous searches are kept, but may be replaced
+    order.new_search()
+    qcache.clear()
+    spos = mad100.SearchPosition(pos)
     
-    print('thinking ....   max nodes: %d' %(maxn) )
+    if tc is None:
+        print('thinking ....   max nodes: %d' %(maxn) )
+    else:
+        tc.start()
+        print('thinking ....   %s' %(tc) )
+    smp = smp_start(pos, processes - 1) if processes > 1 else None
     print '%8s %8s %8s %8s' % ('depth', 'nodes', 'gamma', 'score')   # header
 
-    # We limit the depth to some constant, so we don't get a stack overflow in the end game.
-    for depth in range(1, 99):
-        # The inner loop is a binary search on the score of the position.
-        # Inv: lower <= score <= upper
-        # However this may be broken by values from the transposition table,
-        # as they don't have the same concept of p(score). Hence we just use
-        # 'lower < upper - margin' as the loop condition.
-        lower, upper = -MATE_VALUE, MATE_VALUE
-        while lower < upper - 3: 
-            gamma = (lower+upper+1)//2         # bisection !!   gamma === beta
-            score = bound(pos, gamma, depth)   # AlphaBetaWithMemory
-            if score >= gamma:
-                lower = score
-            if score < gamma:
-                upper = score
-
-        print '%8d %8d %8d %8d' % (depth, nodes, gamma, score)
-
-        # We stop deepening if the global node counter shows we have spent too long for this depth
-        if nodes >= maxn:
-            break
-        # We stop deepening if we have already won/lost the game.
-        if abs(score) >= MATE_VALUE:
-            break
-
-    # We can retrieve our best move from the transposition table.
-    entry = tp.get(pos.key())   # key() is board string
-    if entry is not None:
-        return entry.move, entry.score
-    return None, score       # move unknown
+    best, bdepth = (None, 0), 0
+    try:
+        # We limit the depth to some constant, so we don't get a stack overflow in the end game.
+        for depth in range(1, 99):
+            # The inner loop is a binary search on the score of the position.
+            gamma, score = mtd_bi(spos, depth)
+
+            print '%8d %8d %8d %8d' % (depth, nodes, gamma, score)
+            stats.iteration(depth, nodes)
+            order.age()
+
+            # We can retrieve our best move from the transposition table.
+            entry = tp.get(pos.key())   # key() is Zobrist key
+            best = (tp_move(pos, entry), entry.score) if entry is not None else (None, score)
+            bdepth = search_depth = depth
+
+            # We stop deepening if the global node counter shows we have spent too long for this depth,
+            # or if the time control predicts that the next iteration takes too long.
+            if tc is None and nodes >= maxn:
+                break
+            if tc is not None and not tc.iteration_done(nodes):
+                break
+            # We stop deepening if we have already won/lost the game.
+            if abs(score) >= MATE_VALUE:
+                break
+    except SearchAbort:
+        print('search aborted at depth %d; nodes: %d' % (depth, nodes))
+    finally:
+        timer = None
+        if smp is not None:
+            start = time.time()
+            best = smp_stop(pos, smp, bdepth, best)
+            stats.phase('helpers', time.time() - start)
+
+    stats.finish(nodes, order)
+    print(order.report())
+    return SearchResult(best[0], best[1], stats)
 
 def gen_pv(pos, tp):
     # Returns generator of principal variation list of scores and moves from transposition table
@@ -171,40 +380,136 @@ def gen_pv(pos, tp):
            break    # Loop
         if entry is None:
            break
-        if entry.move is None:
-           yield Entry_pv(postemp, entry.score, entry.move)
+        move = tp_move(postemp, entry)
+        if move is None:
+           yield Entry_pv(postemp, entry.score, move)
            break
 
-        yield Entry_pv(postemp, entry.score, entry.move)
+        yield Entry_pv(postemp, entry.score, move)
         poskeys.add(postemp.key())
-        postemp = postemp.domove(entry.move)
+        postemp = postemp.domove(move)
+
+
+###############################################################################
+# Lazy SMP: parallel MTD-bi search
+###############################################################################
+
+# Helper processes run the same iterative deepening on the same root; odd helpers
+# one ply deeper. They share nothing but the transposition table tp (shared memory),
+# which makes them search different parts of the tree. The helpers are forked, so
+# they inherit tp; this needs the fork start method of multiprocessing (Unix).
+
+SMP_WAIT = 1.0            # seconds between checks of dead helpers when waiting for their results
+
+class SMPStop:
+   # Timer of a helper process: polls the stop event of the main process
+   def __init__(self, event):
+      self.event = event
+
+   def poll(self):
+      return self.event.is_set()
+
+# end class SMPStop
+
+def smp_helper(pos, k, stop, results):
+   # Helper process k. Puts (k, depth, score, move code) for each completed iteration
+   # on the results queue, and (k, None, nodes, 0) when stopped, also after an error.
+   global nodes; nodes = 0
+   global timer; timer = SMPStop(stop)
+   order.new_search()
+   spos = mad100.SearchPosition(pos)
+   try:
+      for depth in range(1 + k % 2, 99):
+         gamma, score = mtd_bi(spos, depth)
+         entry = tp.get(pos.key())
+         if entry is not None:
+            results.put((k, depth, entry.score, entry.move))
+         if abs(score) >= MATE_VALUE or stop.is_set():
+            break
+   except SearchAbort:
+      pass
+   finally:
+      results.put((k, None, nodes, 0))     # final message: smp_stop waits for it
+
+def smp_start(pos, nhelpers):
+   # Start the helper processes; returns (stop event, results queue, processes)
+   stop = multiprocessing.Event()
+   results = multiprocessing.Queue()
+   procs = [multiprocessing.Process(target=smp_helper, args=(pos, k, stop, results))
+            for k in range(1, nhelpers + 1)]
+   for p in procs:
+      p.daemon = True
+      p.start()
+   return stop, results, procs
+
+def smp_stop(pos, smp, depth, best):
+   # Stop the helper processes. Returns best move and score of the deepest completed
+   # iteration of all processes; depth and best are of the main process.
+   stop, results, procs = smp
+   stop.set()
+   hnodes, running = 0, len(procs)
+   while running > 0:
+      try:
+         k, hdepth, score, code = results.get(timeout=SMP_WAIT)
+      except Empty:
+         if not any(p.is_alive() for p in procs):
+            break                # a helper died without its final message
+         continue
+      if hdepth is None:
+         hnodes += score         # final message: node count of the helper
+         running -= 1
+      elif hdepth > depth and code != 0:
+         depth, best = hdepth, (code_move(pos, code), score)
+   for p in procs:
+      p.join(SMP_WAIT)
+      if p.is_alive(): p.terminate()
+   print('helpers: %d  nodes: %d  deepest iteration: %d' % (len(procs), hnodes, depth))
+   return best
 
 
 ###############################################################################
 # Search logic for Principal Variation Forced (PVF)
 ###############################################################################
 
-Entry_tpf = namedtuple('Entry_tpf', 'depth score move')
-tpf = OrderedDict()                   # Transposition table: dict of Entry_tpf
+tpf = TransTable(TABLE_SIZE_MB)       # Transposition table; scores are exact
 
-def minimax_pvf(pos, depth, player):
+def minimax_pvf(pos, depth, player, ply=0):
    # Fail soft negamax ab-pruning
    # Parameter player: alternating +1 and -1 (player resp. opponent)
+   # Parameter ply: distance to the root (for the move ordering)
    # Test for dedicated problems shows: can be much faster than MTD-bi search 
 
    global xnodes; xnodes += 1
+   if xnodes & POLL_MASK == 0 and timer is not None and timer.poll():
+      raise SearchAbort       # time is up: unwind to search_pvf()
+
+   # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
+   if depth <= 0:
+      if mad100_egtb.max_pieces:
+         tscore = tb_score(pos)
+         if tscore is not None:
+            return tscore
+      return quiesce(pos, ply)
 
    # Read transposition table
-   entry = tpf.get(pos.key()) 
-   if entry is not None and depth <= entry.depth:
-      return entry.score      # Stop searching this node
+   poskey = pos.key()
+   entry = tpf.get(poskey)
+   stats.tt_probes += 1
+   if entry is not None:
+      stats.tt_hits += 1
+      if depth <= entry.depth:
+         stats.tt_cuts += 1
+         return entry.score      # Stop searching this node
 
-   # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
-   if depth <= 0 and not hasCapture(pos):
-      return pos.score    # Evaluate position
+   # Exact result of the endgame tablebases (not at the root: we need a move there)
+   if mad100_egtb.max_pieces and ply > 0:
+      tscore = tb_score(pos)
+      if tscore is not None:
+         return tscore
 
    best, bmove = -MATE_VALUE, None
-   moveList = list(gen_moves(pos))
+   hcode = 0 if entry is None else entry.move
+   moveList = gen_staged(pos, hcode, None, order, ply)
 
    #   mCount = sum(1 for x in moveList)   # count moves
    #   if mCount == 0:
@@ -212,10 +517,11 @@ def minimax_pvf(pos, depth, player):
 
    mCount = 0
    for move in moveList:
-      child = pos.domove(move)
-
-      if player == 0:
-         if len(move.takes) == 0 and not hasCapture(child):
+      if player == 0 and len(move.takes) == 0:
+         undo = pos.make(move)
+         forcing = hasCapture(pos)
+         pos.unmake(move, undo)
+         if not forcing:
             # Player decides only to look at moves that leads to a capture for the opponent.
             # But captures of the player are always inspected.
             continue
@@ -229,73 +535,129 @@ def minimax_pvf(pos, depth, player):
       ## print('===' * depth + '> ' + mrender_move(player, move) )
 
       mCount += 1
-      score = -minimax_pvf(child, depth-1, 1-player)
+      undo = pos.make(move)
+      score = -minimax_pvf(pos, depth-1, 1-player, ply+1)
+      pos.unmake(move, undo)
       if score > best:
          best = score
          bmove = move
 
    if mCount == 0:      # stop: no moves that leads to a capture for the opponent.
       return pos.score
+   stats.expanded += 1
+   stats.moves += mCount
 
    # Write transposition table
    if entry is None or depth > entry.depth:
-      tpf[pos.key()] = Entry_tpf(depth, best, bmove) 
-      if len(tpf) > TABLE_SIZE:
-         tpf.popitem()  # popitem removes and returns an arbitrary (key,value) pair
+      tpf.put(poskey, depth, best, EXACT, 0 if bmove is None else move_code(pos, bmove))
 
    return best
 
-def search_pvf(pos, maxn=MAX_NODES):
+def search_pvf(pos, maxn=MAX_NODES, tc=None):
    # Iterative deepening of forced variation sequence.
+   # Parameter tc: TimeControl (see mad100_time) or None to search with node budget maxn.
    global xnodes; xnodes = 0
+   global timer; timer = tc
+   global stats; stats = SearchStats('pvf')
+   global search_depth; search_depth = 0
    player = 0            # 0 = starting player; 1 = opponent 
-   if len(tpf) > (TABLE_SIZE // 2):
-      global tpf
-      tpf.clear()            # empty dict when half full
+   tpf.new_search()      # entries of previous searches are kept, but may be replaced
+   order.new_search()
+   qcache.clear()
+   spos = mad100.SearchPosition(pos)    # mutable copy for make/unmake
 
-   print('thinking ....   max nodes: %d' %(maxn) )
+   if tc is None:
+      print('thinking ....   max nodes: %d' %(maxn) )
+   else:
+      tc.start()
+      print('thinking ....   %s' %(tc) )
    print '%8s %8s %8s' % ('depth', 'nodes', 'score')   # header
 
-   for depth in range(1, 99):
-      best = minimax_pvf(pos, depth, player)
+   result = (None, 0)
+   try:
+      for depth in range(1, 99):
+         best = minimax_pvf(spos, depth, player)
 
-      ## REPORT
-      print '%8d %8d %8d' % (depth, xnodes, best)
-      #print(render_pv(0, pos, tpf))
+         ## REPORT
+         print '%8d %8d %8d' % (depth, xnodes, best)
+         stats.iteration(depth, xnodes)
+         order.age()
+         #print(render_pv(0, pos, tpf))
 
-      # We stop deepening if the global N counter shows we have spent too long for this depth
-      if xnodes >= maxn:
-         break
+         # We can retrieve our best move from the transposition table.
+         entry = tpf.get(pos.key())
+         result = (tp_move(pos, entry) if entry is not None else None, best)
+         search_depth = depth
 
-      # Looking for another stop criterium.
-      # Sometimes a solution is found but search is going on until max nodes is reached.
-      # We like to stop sooner and prevent waiting. But which stop citerium?
+         # We stop deepening if the global N counter shows we have spent too long for this depth
+         if tc is None and xnodes >= maxn:
+            break
+         if tc is not None and not tc.iteration_done(xnodes):
+            break
 
-   # We can retrieve our best move from the transposition table.
-   entry = tpf.get(pos.key()) 
-   if entry is not None:
-      return entry.move, best
-   return None, best       # move unknown
+         # Looking for another stop criterium.
+         # Sometimes a solution is found but search is going on until max nodes is reached.
+         # We like to stop sooner and prevent waiting. But which stop citerium?
+   except SearchAbort:
+      print('search aborted at depth %d; nodes: %d' % (depth, xnodes))
+   finally:
+      timer = None
+
+   stats.finish(xnodes, order)
+   return SearchResult(result[0], result[1], stats)
 
 ###############################################################################
 # Normal alpha-beta search with aspiration windows
 ###############################################################################
 
-Entry_tpab = namedtuple('Entry_tpab', 'depth score move')
-tpab = OrderedDict()              # Transposition table: dict of Entry_tpab
+tpab = TransTable(TABLE_SIZE_MB)  # Transposition table; scores from side to move, like tp and tpf
+
+def tpab_bound(entry, player):
+   # Returns score and bound type of an entry of tpab from the view of the starting player
+   if player == 0:
+      return entry.score, entry.flag
+   flag = {LOWER: UPPER, UPPER: LOWER, EXACT: EXACT}[entry.flag]
+   return -entry.score, flag
 
-def alphabeta(pos, alpha, beta, depthleft, player):
+def alphabeta(pos, alpha, beta, depthleft, player, ply=0):
    # Fail soft: function returns value that may exceed its function call arguments.
    # Separate player code for better understanding.
    # Use of the transposition table tpab 
+   # Parameter ply: distance to the root (for the killer moves)
    # TEST: uses 30-50% MORE nodes than MTD-bi search for getting the same result
 
    global ynodes; ynodes += 1
+   if ynodes & POLL_MASK == 0 and timer is not None and timer.poll():
+      raise SearchAbort       # time is up: unwind to search_ab()
+
+   # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
+   # The score of quiesce() is from the side to move: player 1 minimizes.
+   if depthleft <= 0:
+      score = None
+      if mad100_egtb.max_pieces:
+         score = tb_score(pos)
+      if score is None:
+         score = quiesce(pos, ply)
+      return score if player == 0 else -score
 
    # Read transposition table
-   entry = tpab.get(pos.key()) 
-   if entry is not None and depthleft <= entry.depth:
-      return entry.score      # We know already the result: stop searching this node
+   poskey = pos.key()
+   entry = tpab.get(poskey)
+   stats.tt_probes += 1
+   if entry is not None:
+      stats.tt_hits += 1
+      if depthleft <= entry.depth:
+         tscore, tflag = tpab_bound(entry, player)
+         if ( tflag == EXACT or tflag == LOWER and tscore >= beta or
+              tflag == UPPER and tscore <= alpha ):
+            stats.tt_cuts += 1
+            return tscore        # We know already the result: stop searching this node
+
+   # Exact result of the endgame tablebases (not at the root: we need a move there)
+   if mad100_egtb.max_pieces and ply > 0:
+      tscore = tb_score(pos)
+      if tscore is not None:
+         return tscore if player == 0 else -tscore
 
    # Stop searching if we have won/lost.
    if abs(pos.score) >= MATE_VALUE:
@@ -306,112 +668,196 @@ def alphabeta(pos, alpha, beta, depthleft, player):
    # that you exceed beta, you assume that you'd also exceed beta if you went and searched all of your moves.
    # So you simply return beta without searching any moves.
    #
-   nullswitch = True    ### *** set ON/OFF *** ###
-   R = 3 if depthleft > 8 else 2              # depth reduction
-   if depthleft >= 4 and not hasCapture(pos) and nullswitch:
-      child = pos.rotate()    # position of opponent without move of player
-      nullscore = alphabeta(child, alpha, alpha+1, depthleft-1-R, 1-player)   # RECURSION
+   R = NULL_R + 1 if depthleft > 8 else NULL_R     # depth reduction
+   capture = hasCapture(pos)       # capture availability; computed only once for this node
+
+   # RAZORING: far outside the window near the leaves, the quiet moves will not bring us back.
+   # The score of pos is from the side to move: player 1 minimizes -pos.score.
+   futility = futilityswitch['ab'] and not capture and ply > 0
+   if futility and depthleft == RAZOR_DEPTH:
+      if player == 0 and pos.score + RAZOR_MARGIN <= alpha:
+         stats.razor_cuts += 1
+         return pos.score
+      if player == 1 and -pos.score - RAZOR_MARGIN >= beta:
+         stats.razor_cuts += 1
+         return -pos.score
+
+   if depthleft >= 4 and not capture and nullswitch:
+      stats.null_tries += 1
+      undo = pos.make(None)    # position of opponent without move of player
+      nullscore = alphabeta(pos, alpha, alpha+1, depthleft-1-R, 1-player, ply+1)   # RECURSION
+      pos.unmake(None, undo)
       if player == 0:
          if nullscore >= beta:
+            stats.null_cuts += 1
             return beta      # Nullscore high: stop searching this node
       if player == 1:
          if nullscore <= alpha:
+            stats.null_cuts += 1
             return alpha      # Nullscore low: stop searching this node
 
-   moveList = sorted(gen_moves(pos), key=pos.eval_move, reverse=True)
+   hcode = 0 if entry is None else entry.move
+   moveList = gen_staged(pos, hcode, capture, order, ply)     # staged: hash move, captures, quiet moves
+   nmoves = 0
+   futile = futility and depthleft <= 2                  # FUTILITY PRUNING of quiet moves
+   reduce = lmrswitch['ab'] and depthleft >= LMR_DEPTH and not capture and ply > 0    # LMR
 
    if player == 0:
-      # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
-      if depthleft <= 0 and not hasCapture(pos):
-         return pos.score    # Evaluate position
-
       bestValue = -MATE_VALUE 
       bestMove = None
       alphaMax = alpha            # clone of alpha (we do not want to change input parameter)
 
       for move in moveList:
-         child = pos.domove(move)
-         score = alphabeta(child, alphaMax, beta, depthleft-1, 1-player)   # RECURSION
+         nmoves += 1
+         quiet = (futile or reduce and nmoves > LMR_MOVES) and quiet_move(pos, move)
+         if futile and quiet:
+            estimate = pos.score + pos.eval_move(move) + FUTILITY_MARGIN[depthleft]
+         undo = pos.make(move)
+         if quiet and hasCapture(pos):
+            quiet = False         # the opponent can capture: maybe a shot
+         if futile and quiet and estimate <= alphaMax:
+            pos.unmake(move, undo)
+            stats.futility_prunes += 1
+            bestValue = max(bestValue, estimate)
+            continue
+         if reduce and quiet and nmoves > LMR_MOVES:
+            stats.lmr_reductions += 1
+            score = alphabeta(pos, alphaMax, alphaMax+1, depthleft-2, 1-player, ply+1)   # reduced
+            if score > alphaMax:
+               stats.lmr_researches += 1
+               score = alphabeta(pos, alphaMax, beta, depthleft-1, 1-player, ply+1)
+         else:
+            score = alphabeta(pos, alphaMax, beta, depthleft-1, 1-player, ply+1)   # RECURSION
+         pos.unmake(move, undo)
 
          if score > bestValue:
             bestValue = score                  # bestValue is running max of score
             bestMove = move
          alphaMax = max(alphaMax, bestValue)   # alphaMax is running max of alpha
-         if alphaMax >= beta: break            # beta cut-off
+         if alphaMax >= beta:                  # beta cut-off
+            order.cutoff(move, ply, depthleft, nmoves)
+            break
    if player == 1:
-      # Evaluate or search further until end-leaves has no capture(s) (QUIESCENCE SEARCH)
-      if depthleft <= 0 and not hasCapture(pos):
-         return -1 * pos.score    # Evaluate position
-
       bestValue = MATE_VALUE  
       bestMove = None
       betaMin = beta              # clone of beta
 
       for move in moveList:
-         child = pos.domove(move)
-         score = alphabeta(child, alpha, betaMin, depthleft-1, 1-player) 
+         nmoves += 1
+         quiet = (futile or reduce and nmoves > LMR_MOVES) and quiet_move(pos, move)
+         if futile and quiet:
+            estimate = -(pos.score + pos.eval_move(move) + FUTILITY_MARGIN[depthleft])
+         undo = pos.make(move)
+         if quiet and hasCapture(pos):
+            quiet = False         # the opponent can capture: maybe a shot
+         if futile and quiet and estimate >= betaMin:
+            pos.unmake(move, undo)
+            stats.futility_prunes += 1
+            bestValue = min(bestValue, estimate)
+            continue
+         if reduce and quiet and nmoves > LMR_MOVES:
+            stats.lmr_reductions += 1
+            score = alphabeta(pos, betaMin-1, betaMin, depthleft-2, 1-player, ply+1)   # reduced
+            if score < betaMin:
+               stats.lmr_researches += 1
+               score = alphabeta(pos, alpha, betaMin, depthleft-1, 1-player, ply+1)
+         else:
+            score = alphabeta(pos, alpha, betaMin, depthleft-1, 1-player, ply+1)
+         pos.unmake(move, undo)
          if score < bestValue:
             bestValue = score                  # bestValue is running min of score
             bestMove = move
          betaMin = min(betaMin, bestValue)     # betaMin is running min of beta
-         if betaMin <= alpha: break            # alpha cut-off
+         if betaMin <= alpha:                  # alpha cut-off
+            order.cutoff(move, ply, depthleft, nmoves)
+            break
+
+   if nmoves > 0:
+      stats.expanded += 1
+      stats.moves += nmoves
 
    # Write transposition table
+   # The bound type follows from the window; the entry is saved from the view of the side to move.
    if entry is None or depthleft > entry.depth:
-      tpab[pos.key()] = Entry_tpab(depthleft, bestValue, bestMove)  # gamma not used
-      if len(tpab) > TABLE_SIZE:
-         tpab.popitem()   # popitem removes and returns an arbitrary (key,value) pair
+      flag = UPPER if bestValue <= alpha else LOWER if bestValue >= beta else EXACT
+      if player == 1:
+         flag = {LOWER: UPPER, UPPER: LOWER, EXACT: EXACT}[flag]
+      mcode = 0 if bestMove is None else move_code(pos, bestMove)
+      tpab.put(poskey, depthleft, bestValue if player == 0 else -bestValue, flag, mcode)
 
    return bestValue
 
-def search_ab(pos, maxn=MAX_NODES):
+def search_ab(pos, maxn=MAX_NODES, tc=None):
     # Iterative deepening alpha-beta search enhanced with aspiration windows
+    # Parameter tc: TimeControl (see mad100_time) or None to search with node budget maxn.
+    # Returns the best move and score of the last completed iteration.
     global ynodes; ynodes = 0
-    if len(tpab) > (TABLE_SIZE // 2):
-       global tpab
-       tpab.clear()            # empty dict when half full
+    global timer; timer = tc
+    global stats; stats = SearchStats('ab')
+    global search_depth; search_depth = 0
+    tpab.new_search()      # entries of previous searches are kept, but may be replaced
+    order.new_search()
+    qcache.clear()
+    spos = mad100.SearchPosition(pos)    # mutable copy for make/unmake
 
     lower, upper = -MATE_VALUE, MATE_VALUE
-    valWINDOW = 50         # ASPIRATION WINDOW: tune for optimal results
 
-    print('thinking ....   max nodes: %d' %(maxn) )
+    if tc is None:
+        print('thinking ....   max nodes: %d' %(maxn) )
+    else:
+        tc.start()
+        print('thinking ....   %s' %(tc) )
     print '%8s %8s %8s %8s %8s' % ('depth', 'nodes', 'score', 'alpha', 'beta')   # header
 
     # We limit the depth to some constant, so we don't get a stack overflow in the end game.
     alpha, beta = lower, upper
     depthleft = 1
-    while depthleft < 100:
-        player = 0            # 0 = starting player is max; 1 = opponent 
-        score = alphabeta(pos, alpha, beta, depthleft, player)
-
-        print '%8d %8d %8d %8d %8d' % (depthleft, ynodes, score, alpha, beta)
-
-        # We stop deepening if the global N counter shows we have spent too long for this depth
-        if ynodes >= maxn:
-            break
-
-        # We stop deepening if we have already won/lost the game.
-        if abs(score) >= MATE_VALUE:
-            break
-
-        if score <= alpha or score >= beta:
-           alpha, beta = lower, upper
-           continue   # sadly we must repeat with same depthleft
-
-        alpha, beta = score - valWINDOW, score + valWINDOW
-        depthleft += 1
-
-    # We can retrieve our best move from the transposition table.
-    entry = tpab.get(pos.key())
-    if entry is not None:
-       return entry.move, entry.score
-    return None, score       # move unknown
+    best = (None, 0)
+    try:
+        while depthleft < 100:
+            player = 0            # 0 = starting player is max; 1 = opponent 
+            score = alphabeta(spos, alpha, beta, depthleft, player)
+
+            print '%8d %8d %8d %8d %8d' % (depthleft, ynodes, score, alpha, beta)
+            stats.iteration(depthleft, ynodes)
+            order.age()
+
+            # We can retrieve our best move from the transposition table.
+            entry = tpab.get(pos.key())
+            best = (tp_move(pos, entry), entry.score) if entry is not None else (None, score)
+            search_depth = depthleft
+
+            # We stop deepening if the global N counter shows we have spent too long for this depth
+            if tc is None and ynodes >= maxn:
+                break
+            if tc is not None and not tc.iteration_done(ynodes):
+                break
+
+            # We stop deepening if we have already won/lost the game.
+            if abs(score) >= MATE_VALUE:
+                break
+
+            if score <= alpha or score >= beta:
+               alpha, beta = lower, upper
+               continue   # sadly we must repeat with same depthleft
+
+            alpha, beta = score - valWINDOW, score + valWINDOW
+            depthleft += 1
+    except SearchAbort:
+        print('search aborted at depth %d; nodes: %d' % (depthleft, ynodes))
+    finally:
+        timer = None
+
+    stats.finish(ynodes, order)
+    print(order.report())
+    return SearchResult(best[0], best[1], stats)
 
 ###############################################################################
 # Logic Opening book
 ###############################################################################
 Entry_open = namedtuple('Entry_open', 'freq')
 tp_open = OrderedDict()           # Transposition Table: dict of Entry
+book_bin = None                   # BinaryBook (see mad100_book) or None: use tp_open
 WHITE, BLACK = 0, 1
 
 def book_isPresent(f):
@@ -425,6 +871,7 @@ def book_readFile(f):
 
    print("Reading opening book <" + f + ">  ....")
    global tp_open; tp_open = OrderedDict()   # reset transposition table
+   book_closeBinary()
    file = open(f, 'r')
    linecount = 0
    movecount = 0
@@ -477,23 +924,56 @@ def book_addEntry(pos, move):
       tp_open[posnew.key()] = Entry_open(freq) 
    return True, posnew
 
+def book_openBinary(f, textfile=None):
+   # Open binary opening book (see mad100_book); compiled from textfile if not present
+   global book_bin
+   if not book_isPresent(f):
+      if textfile is None or not book_isPresent(textfile):
+         print('Opening book not available: ' + f)
+         return 0
+      print("Compiling opening book <" + textfile + "> to <" + f + ">  ....")
+      mad100_book.compile_book(textfile, f)
+   book_closeBinary()
+   try:
+      book_bin = mad100_book.BinaryBook(f)
+   except ValueError:
+      if textfile is None or not book_isPresent(textfile): raise
+      print("Compiling opening book <" + textfile + "> to <" + f + ">  ....")   # older version
+      mad100_book.compile_book(textfile, f)
+      book_bin = mad100_book.BinaryBook(f)
+   global tp_open; tp_open = OrderedDict()
+   print("Opening book opened: " + str(book_bin.count) + " records")
+
+def book_closeBinary():
+   global book_bin
+   if book_bin is not None:
+      book_bin.close()
+      book_bin = None
+
 def book_searchMove(pos):
    candidates = []    # list of candidate moves
    entry_cand = namedtuple('entry_cand', 'move freq')
-   for move in gen_moves(pos):
-      posnew = pos.domove(move)
-      entry = tp_open.get(posnew.key()) 
-      if entry is not None:
-         ##print('move:', move)
-         candidates.append(entry_cand(move, entry.freq))         
+   if book_bin is not None:
+      # Binary book: one probe for all moves of the position
+      for move, weight in book_bin.moves(pos):
+         candidates.append(entry_cand(move, weight))
+   elif len(tp_open) > 0:
+      for move in gen_moves(pos):
+         posnew = pos.domove(move)
+         entry = tp_open.get(posnew.key()) 
+         if entry is not None:
+            ##print('move:', move)
+            candidates.append(entry_cand(move, entry.freq))         
 
    if len(candidates) > 0:
-      # Two strategies to select one candidate move
+      # Three strategies to select one candidate move
       # 1. Select move with highest frequence
       # 2. Select a random candidate move
+      # 3. Select a random candidate move with probability proportional to its frequence (weight)
+      #    A book of mad100_bookbuild gives the best moves the highest weight.
       candidates.sort(key=lambda x: x.freq, reverse=True)
 
-      s = 1       # make choice
+      s = 2       # make choice
       if s == 0:
          high_i = 0                                        # highest freq after sort
          sel_move = candidates[high_i].move 
@@ -504,15 +984,23 @@ def book_searchMove(pos):
          sel_move = candidates[rand_i].move
          ##print('candidate random:', candidates[rand_i].move, candidates[rand_i].freq ) 
 
+      if s == 2:
+         r = randint( 1, sum(x.freq for x in candidates) )  # weighted random
+         for cand in candidates:
+            r -= cand.freq
+            if r <= 0: break
+         sel_move = cand.move
+
       return sel_move
    else:
       return None
 
 def clearSearchTables():
-   # Removes all key-value pairs from the transposition tables.
+   # Removes all key-value pairs from the transposition tables and the quiescence cache.
    tp.clear()
    tpf.clear()
    tpab.clear()
+   qcache.clear()
 
 ###############################################################################
 def main():
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Search statistics
+#=====================================================================
+
+# Each search of mad100_search fills a SearchStats object and returns it with the
+# best move and score (see SearchResult). The counters are filled by the node
+# functions (bound, minimax_pvf, alphabeta):
+# - nodes: nodes of the search; qnodes: nodes of the quiescence search (quiesce: captures only)
+# - qcache_hits: quiescence nodes found in the quiescence cache
+# - seldepth: selective depth, the max distance to the root of the quiescence search
+# - tt_probes, tt_hits, tt_cuts: probes of the transposition table, entries found and
+#   entries that ended the search of the node
+# - null_tries, null_cuts: null move searches and null moves that ended the search of the node
+# - futility_prunes, razor_cuts: quiet moves skipped by futility pruning and nodes cut by razoring
+# - lmr_reductions, lmr_researches: reduced searches of late moves and their searches again
+#   to full depth after a fail high
+# - expanded, moves: nodes that searched one or more moves and the number of moves searched
+#   (average branching factor = moves / expanded)
+# - cuts, first_cuts: cut offs and cut offs by the first move (from MoveOrder)
+# - mt_probes, mt_hits: probes and hits of the moveTable (see mad100_moves)
+# - bisections: searches of bound() of the MTD-bi binary search
+# - iterations: per depth (depth, nodes, bisections, seconds)
+# - phases: seconds per phase of the search (book, iterations, parallel helpers)
+
+import time
+import mad100_moves
+
+
+class SearchStats:
+   # Statistics of one search
+
+   def __init__(self, method=''):
+      self.method = method
+      self.nodes = self.qnodes = 0
+      self.qcache_hits = self.seldepth = 0
+      self.tt_probes = self.tt_hits = self.tt_cuts = 0
+      self.null_tries = self.null_cuts = 0
+      self.futility_prunes = self.razor_cuts = 0
+      self.lmr_reductions = self.lmr_researches = 0
+      self.expanded = self.moves = 0
+      self.cuts = self.first_cuts = 0
+      self.mt_probes = self.mt_hits = 0
+      self.bisections = 0
+      self.iterations = []
+      self.phases = {}
+      self.secs = 0.0
+      self.start()
+
+   def start(self):
+      # Start the clock of the search and of the first iteration
+      self.t0 = self.tlast = time.time()
+      self.nlast = self.blast = 0
+      self.mt0 = list(mad100_moves.moveTableStats)
+
+   def iteration(self, depth, nodes):
+      # Register a completed iteration; nodes is the node count of the search so far
+      now = time.time()
+      self.iterations.append((depth, nodes - self.nlast, self.bisections - self.blast, now - self.tlast))
+      self.phase('iterations', now - self.tlast)
+      self.tlast, self.nlast, self.blast = now, nodes, self.bisections
+
+   def phase(self, name, secs):
+      self.phases[name] = self.phases.get(name, 0.0) + secs
+
+   def finish(self, nodes, order=None):
+      # End of the search: node count of the search and cut offs of MoveOrder order
+      self.nodes = nodes
+      if order is not None:
+         self.cuts, self.first_cuts = order.cuts, order.first_cuts
+      self.mt_probes = mad100_moves.moveTableStats[0] - self.mt0[0]
+      self.mt_hits = mad100_moves.moveTableStats[1] - self.mt0[1]
+      self.secs = time.time() - self.t0
+
+   def branching(self):
+      # Average branching factor: moves searched per expanded node
+      return float(self.moves) / self.expanded if self.expanded > 0 else 0.0
+
+   def ebf(self):
+      # Effective branching factor: nodes of the last iteration / nodes of the iteration before
+      if len(self.iterations) < 2 or self.iterations[-2][1] == 0: return 0.0
+      return float(self.iterations[-1][1]) / self.iterations[-2][1]
+
+   def report(self):
+      # Returns the statistics as text
+      def pct(n, m):
+         return 100.0 * n / m if m > 0 else 0.0
+      lines = [
+         'search: %s  time: %.3f  nodes: %d  nps: %d' %
+            (self.method or '-', self.secs, self.nodes, self.nodes / self.secs if self.secs > 0 else 0),
+         'quiescence nodes: %d  cache hits: %d (%.1f%%)  selective depth: %d' %
+            (self.qnodes, self.qcache_hits, pct(self.qcache_hits, self.qnodes), self.seldepth),
+         'tt probes: %d  hits: %d (%.1f%%)  cutoffs: %d (%.1f%%)' %
+            (self.tt_probes, self.tt_hits, pct(self.tt_hits, self.tt_probes),
+             self.tt_cuts, pct(self.tt_cuts, self.tt_probes)),
+         'moveTable probes: %d  hits: %d (%.1f%%)' %
+            (self.mt_probes, self.mt_hits, pct(self.mt_hits, self.mt_probes)),
+         'null move tries: %d  cutoffs: %d (%.1f%%)' %
+            (self.null_tries, self.null_cuts, pct(self.null_cuts, self.null_tries)),
+         'futility prunes: %d  razor cuts: %d  late move reductions: %d  searched again: %d (%.1f%%)' %
+            (self.futility_prunes, self.razor_cuts, self.lmr_reductions, self.lmr_researches,
+             pct(self.lmr_researches, self.lmr_reductions)),
+         'cut nodes: %d  first move cuts: %d (%.1f%%)' %
+            (self.cuts, self.first_cuts, pct(self.first_cuts, self.cuts)),
+         'branching factor: %.2f  effective: %.2f' % (self.branching(), self.ebf()),
+      ]
+      if self.iterations:
+         lines.append('%8s %10s %8s %8s' % ('depth', 'nodes', 'bisect', 'secs'))
+         for depth, nodes, bisections, secs in self.iterations[-20:]:     # the last 20
+            lines.append('%8d %10d %8s %8.3f' % (depth, nodes, bisections if self.bisections else '-', secs))
+      lines.append('phases: ' + '  '.join('%s %.3f' % (name, secs) for name, secs in sorted(self.phases.items())))
+      return '\n'.join(lines)
+
+# end class SearchStats
+
+
+class SearchResult(tuple):
+   # Result of a search: the tuple (move, score), so "move, score = search(pos)" works,
+   # with the statistics of the search as attribute stats
+
+   def __new__(cls, move, score, stats):
+      res = tuple.__new__(cls, (move, score))
+      res.stats = stats
+      return res
+
+# end class SearchResult
+
+
+# *********************************************************************************
+def main():
+   print('nothing to do')
+   return 0
+
+if __name__ == '__main__':
+    main()
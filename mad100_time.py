@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Time control of the searches
+#=====================================================================
+
+# Two modes:
+# 1. fixed time per move: TimeControl(movetime=secs)
+# 2. game clock: TimeControl(clock=secs, inc=secs, movestogo=n)
+#    The time for a move is the remaining time divided over the moves to go
+#    (MOVES_TO_GO if unknown) plus the increment.
+#
+# Each mode has two limits:
+# - soft: no new iteration is started after the soft limit, nor if the prediction
+#   of the cost of the next iteration passes the hard limit.
+#   The prediction is: time of the last iteration * effective branching factor
+#   (nodes of the last iteration / nodes of the iteration before).
+# - hard: the search is aborted. The searches poll the stop flag every POLL_NODES
+#   nodes and raise SearchAbort; they return the best move of the last completed iteration.
+#
+# The first iteration is never aborted, so there is always a move.
+
+import time
+
+POLL_NODES = 1024           # poll interval in nodes; power of two
+POLL_MASK = POLL_NODES - 1
+MOVES_TO_GO = 30            # assumed number of moves to go if unknown
+HARD_FACTOR = 3             # hard limit = HARD_FACTOR * soft limit (clock mode)
+MARGIN = 0.05               # seconds kept as safety margin
+
+
+class SearchAbort(Exception):
+   # Raised inside a search if the time is up or the search is stopped
+   pass
+
+
+class TimeControl:
+   # Time limits of one search; start() must be called at the start of every search
+
+   def __init__(self, movetime=None, clock=None, inc=0.0, movestogo=None):
+      self.movetime = movetime
+      self.clock = clock
+      self.inc = inc
+      self.movestogo = movestogo
+      self.start()
+
+   def start(self):
+      # Set the limits for a new search
+      if self.movetime is not None:
+         self.soft = self.hard = max(0.0, self.movetime - MARGIN)
+      elif self.clock is not None:
+         mtg = self.movestogo if self.movestogo else MOVES_TO_GO
+         reserve = max(0.0, self.clock - MARGIN)
+         self.soft = min(reserve / mtg + self.inc, reserve)
+         self.hard = min(HARD_FACTOR * self.soft, reserve / 2 + self.inc, reserve)
+         self.soft = min(self.soft, self.hard)
+      else:
+         self.soft = self.hard = float('inf')
+      self.t0 = time.time()
+      self.stopped = False
+      self.abortable = False           # set after the first iteration
+      self.iter_nodes = []             # nodes of each completed iteration
+      self.iter_times = []             # seconds of each completed iteration
+      self.last_nodes, self.last_time = 0, self.t0
+
+   def elapsed(self):
+      return time.time() - self.t0
+
+   def stop(self):
+      # Stop the search (may be called by another thread)
+      self.stopped = True
+
+   def poll(self):
+      # Returns True if the search must be aborted
+      if not self.abortable:
+         return False
+      if not self.stopped and time.time() - self.t0 >= self.hard:
+         self.stopped = True
+      return self.stopped
+
+   def iteration_done(self, nodes):
+      # Register a completed iteration; nodes is the node counter of the search.
+      # Returns True if a next iteration may be started.
+      now = time.time()
+      self.iter_nodes.append(nodes - self.last_nodes)
+      self.iter_times.append(now - self.last_time)
+      self.last_nodes, self.last_time = nodes, now
+      self.abortable = True
+      if self.stopped: return False
+      elapsed = now - self.t0
+      return elapsed < self.soft and elapsed + self.predict() <= self.hard
+
+   def ebf(self):
+      # Returns the effective branching factor of the last two iterations
+      if len(self.iter_nodes) < 2 or self.iter_nodes[-2] == 0:
+         return 1.0
+      return max(1.0, float(self.iter_nodes[-1]) / self.iter_nodes[-2])
+
+   def predict(self):
+      # Returns the predicted time of the next iteration
+      if not self.iter_times: return 0.0
+      return self.iter_times[-1] * self.ebf()
+
+   def used(self, secs):
+      # Update the game clock after a move that took secs
+      if self.clock is None: return
+      self.clock = max(0.0, self.clock - secs) + self.inc
+      if self.movestogo:
+         self.movestogo -= 1
+         if self.movestogo == 0: self.movestogo = None
+
+   def __str__(self):
+      if self.movetime is not None:
+         return 'time per move: %.2fs' % self.movetime
+      if self.clock is not None:
+         mtg = ' moves to go: %d' % self.movestogo if self.movestogo else ''
+         return 'clock: %.2fs increment: %.2fs%s' % (self.clock, self.inc, mtg)
+      return 'no time limit'
+
+# end class TimeControl
+
+
+# *********************************************************************************
+def main():
+   print('nothing to do')
+   return 0
+
+if __name__ == '__main__':
+    main()
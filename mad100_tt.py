@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Transposition table with a fixed size
+#=====================================================================
+
+# The table is a preallocated bytearray, divided in buckets of two entries.
+# Each entry is packed in two 64-bit words:
+#   word 0: key XOR data   (a torn write gives a key mismatch instead of wrong data)
+#   word 1: data
+# The data word holds (from low to high bits):
+#   score + SCORE_OFFSET  20 bits
+#   depth + DEPTH_OFFSET   8 bits
+#   flag                   2 bits   (bound type; 0 is an empty slot)
+#   move                  14 bits   (move code, see mad100_moves.move_code; 0 is no move)
+#   generation             8 bits
+#
+# Replacement scheme: the first entry of a bucket is depth-preferred, the second
+# entry is always replaced. An entry of an older generation (previous search)
+# may always be replaced, so the table ages without clearing it.
+#
+# A shared table lives in anonymous shared memory (mmap), inherited by child processes
+# created by fork. No locks are used: a torn write of an entry by two processes gives
+# a key mismatch, so the entry is just not found.
+
+import mmap
+import struct
+from collections import namedtuple
+
+LOWER, UPPER, EXACT = 1, 2, 3       # bound types: score is lower bound, upper bound or exact
+
+SCORE_OFFSET = 1 << 19
+DEPTH_OFFSET = 128
+
+ENTRY_SIZE = 16                     # bytes
+BUCKET_SIZE = 2 * ENTRY_SIZE
+
+Entry_tt = namedtuple('Entry_tt', 'depth score flag move gen')    # move is move code or 0
+
+_bucket = struct.Struct('<QQQQ')
+_entry = struct.Struct('<QQ')
+
+
+def pack(depth, score, flag, move, gen):
+   # Returns data word of an entry
+   return ( (score + SCORE_OFFSET) | (depth + DEPTH_OFFSET) << 20 | flag << 28 |
+            (move & 0x3FFF) << 30 | (gen & 255) << 44 )
+
+def unpack(data):
+   # Returns entry of data word
+   return Entry_tt( ((data >> 20) & 255) - DEPTH_OFFSET, (data & 0xFFFFF) - SCORE_OFFSET,
+                    (data >> 28) & 3, (data >> 30) & 0x3FFF, (data >> 44) & 255 )
+
+
+class TransTable:
+   # Transposition table of size_mb megabytes.
+   # - buf: storage for the entries; a bytearray or any writable buffer (for example
+   #   shared memory) of at least the size of the table.
+   # - shared: if no buf, allocate the storage in shared memory (for parallel search)
+
+   def __init__(self, size_mb, buf=None, shared=False):
+      nbuckets = 1
+      while 2 * nbuckets * BUCKET_SIZE <= size_mb * (1 << 20):
+         nbuckets *= 2
+      self.mask = nbuckets - 1                  # number of buckets is a power of two
+      self.size = nbuckets * BUCKET_SIZE        # bytes
+      if buf is None:
+         buf = mmap.mmap(-1, self.size) if shared else bytearray(self.size)
+      self.buf = buf
+      self.gen = 0
+
+   def get(self, key):
+      # Returns Entry_tt of key or None
+      i = (key & self.mask) * BUCKET_SIZE
+      w0, d0, w1, d1 = _bucket.unpack_from(self.buf, i)
+      if d0 and w0 ^ d0 == key:
+         return unpack(d0)
+      if d1 and w1 ^ d1 == key:
+         return unpack(d1)
+      return None
+
+   def put(self, key, depth, score, flag, move):
+      # Store entry for key
+      i = (key & self.mask) * BUCKET_SIZE
+      w0, d0, w1, d1 = _bucket.unpack_from(self.buf, i)
+      data = pack(depth, score, flag, move, self.gen)
+
+      # Depth-preferred slot: same position, empty, old generation or not deeper
+      if ( not d0 or w0 ^ d0 == key or (d0 >> 44) & 255 != self.gen or
+           depth >= ((d0 >> 20) & 255) - DEPTH_OFFSET ):
+         _entry.pack_into(self.buf, i, key ^ data, data)
+         if d0 and w0 ^ d0 != key:
+            _entry.pack_into(self.buf, i + ENTRY_SIZE, w0, d0)    # keep replaced entry in second slot
+      else:
+         _entry.pack_into(self.buf, i + ENTRY_SIZE, key ^ data, data)   # always replace
+
+   def new_search(self):
+      # Next generation: entries of previous searches become replaceable
+      self.gen = (self.gen + 1) & 255
+
+   def clear(self):
+      # Removes all entries
+      self.buf[:] = b'\x00' * self.size      # also for mmap in Python 2
+      self.gen = 0
+
+   def usage(self):
+      # Returns the number of used entries (slow; for reporting only)
+      count = 0
+      for i in range(0, self.size, ENTRY_SIZE):
+         if _entry.unpack_from(self.buf, i)[1]: count += 1
+      return count
+
+# end class TransTable
+
+
+# *********************************************************************************
+def main():
+   print('nothing to do')
+   return 0
+
+if __name__ == '__main__':
+    main()
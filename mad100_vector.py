@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+#=====================================================================
+# Vectorised operations on batches of positions (NumPy)
+#=====================================================================
+
+# A batch of N positions is a uint8 array of shape (N, 52): one code per square,
+# the same layout as the board of a Position (index 0 and 51 unused):
+#   0 empty, 1 P (man), 2 K (king), 3 p (man of opponent), 4 k (king of opponent)
+# Like the boards of the engine, every position is seen from the player to move.
+#
+# NumPy is optional: the engine itself does not need it. Without NumPy the
+# functions of this module raise ImportError.
+
+from __future__ import print_function
+import mad100
+import mad100_bitboard
+from mad100_moves import generate
+
+try:
+   import numpy as np
+except ImportError:
+   np = None
+
+CODES = {'.': 0, '0': 0, 'P': 1, 'K': 2, 'p': 3, 'k': 4}
+PIECES = '.PKpk'
+LOOKUP = None             # LOOKUP[ord(char)]: code of char
+if np is not None:
+   LOOKUP = np.zeros(256, dtype=np.uint8)
+   for p, code in CODES.items(): LOOKUP[ord(p)] = code
+
+CHUNK = 1 << 16           # positions per step; bounds the size of the temporary arrays
+
+
+def _need_numpy():
+   if np is None:
+      raise ImportError('mad100_vector needs NumPy')
+
+
+###############################################################################
+# Encoding
+###############################################################################
+
+def encode(boards):
+   # Returns batch (N x 52 uint8) of a list of boards (list of 52 char) or positions
+   _need_numpy()
+   data = ''.join(''.join(getattr(board, 'board', board)) for board in boards)
+   chars = np.frombuffer(data.encode('ascii'), dtype=np.uint8)
+   return LOOKUP[chars].reshape(-1, 52)
+
+def encode_bitboards(bbs):
+   # Returns batch (N x 52 uint8) of a list of bitboards (see mad100_bitboard)
+   _need_numpy()
+   planes = np.array([bb[:4] for bb in bbs], dtype=np.uint64).reshape(-1, 4)
+   shifts = np.arange(50, dtype=np.uint64)
+   res = np.zeros((len(planes), 52), dtype=np.uint8)
+   for code in range(1, 5):
+      bits = (planes[:, code - 1, None] >> shifts) & np.uint64(1)       # N x 50
+      res[:, 1:51] += bits.astype(np.uint8) * np.uint8(code)
+   return res
+
+def decode(batch, n):
+   # Returns board (list of 52 char) of position n of batch
+   board = [PIECES[c] for c in batch[n]]
+   board[0] = board[51] = '0'
+   return board
+
+
+###############################################################################
+# Evaluation
+###############################################################################
+
+def _value_table():
+   # VALUE[code][i]: contribution of a piece on square i to the score (see Position.eval_pos)
+   # A piece of the opponent counts as the same piece of the player on the rotated square.
+   table = np.zeros((5, 52), dtype=np.int32)
+   for i in range(1, 51):
+      table[1][i] = mad100.PST['P'][i] + mad100.PMAT['P']
+      table[2][i] = mad100.PST['K'][i] + mad100.PMAT['K']
+      table[3][i] = -(mad100.PST['P'][51 - i] + mad100.PMAT['P'])
+      table[4][i] = -(mad100.PST['K'][51 - i] + mad100.PMAT['K'])
+   return table
+
+VALUE = _value_table() if np is not None else None
+
+def eval_batch(batch):
+   # Returns array (N int32) of the scores of the positions of batch; equal to eval_pos
+   _need_numpy()
+   squares = np.arange(52)
+   res = np.empty(len(batch), dtype=np.int32)
+   for start in range(0, len(batch), CHUNK):
+      codes = batch[start:start + CHUNK]
+      res[start:start + CHUNK] = VALUE[codes, squares].sum(axis=1)     # gather, sum per position
+   return res
+
+
+###############################################################################
+# Move generation
+###############################################################################
+
+# The squares of a batch are padded with square OFF (code OUTSIDE) for the neighbours
+# outside the board. NEXT_INDEX[d][i] is the neighbour of square i in direction d and
+# RAY_INDEX[d][i] the squares of the ray from i in direction d (see mad100_bitboard),
+# both with OFF for outside the board.
+
+OFF, OUTSIDE = 52, 5
+
+if np is not None:
+   NEXT_INDEX = np.full((4, 53), OFF, dtype=np.intp)
+   RAY_INDEX = np.full((4, 52, 10), OFF, dtype=np.intp)     # a ray has at most 9 squares
+   for d in range(4):
+      for i in range(1, 51):
+         if mad100_bitboard.NEXT[d][i]: NEXT_INDEX[d][i] = mad100_bitboard.NEXT[d][i]
+         for n, j in enumerate(mad100_bitboard.RAY[d][i]): RAY_INDEX[d][i][n] = j
+
+def _padded(batch):
+   # Batch with the unused squares 0 and 51 and the extra square OFF outside the board
+   codes = np.empty((len(batch), 53), dtype=np.uint8)
+   codes[:, :52] = batch
+   codes[:, 0] = codes[:, 51] = codes[:, OFF] = OUTSIDE
+   return codes
+
+def men_moves(batch):
+   # Returns bool array (N x 2 x 52): [n, k, i] is True if the man on square i of position n
+   # has a move in direction mad100_bitboard.FORWARD[k] (captures not considered)
+   _need_numpy()
+   codes = _padded(batch)
+   res = np.empty((len(batch), 2, 52), dtype=bool)
+   for k, d in enumerate(mad100_bitboard.FORWARD):
+      res[:, k] = (codes[:, :52] == 1) & (codes[:, NEXT_INDEX[d][:52]] == 0)
+   return res
+
+def _rays(codes):
+   # Returns (codes of the rays: N x 4 x 52 x 10, position of the first piece on each ray)
+   rays = codes[:, RAY_INDEX]
+   return rays, np.argmax(rays != 0, axis=3)       # the padding OFF ends every ray
+
+def has_captures(batch):
+   # Returns bool array (N): True if the player to move has a capture
+   _need_numpy()
+   res = np.zeros(len(batch), dtype=bool)
+   for start in range(0, len(batch), CHUNK):
+      codes = _padded(batch[start:start + CHUNK])
+      opp = (codes == 3) | (codes == 4)
+      capture = np.zeros(len(codes), dtype=bool)
+      for d in range(4):                            # men: opponent piece next, empty square behind
+         nxt = NEXT_INDEX[d][:52]
+         capture |= ((codes[:, :52] == 1) & opp[:, nxt] & (codes[:, NEXT_INDEX[d][nxt]] == 0)).any(axis=1)
+      k = np.nonzero((codes == 2).any(axis=1))[0]    # only the positions with kings
+      if len(k) > 0:                                # kings: first piece on a ray is an opponent piece
+         rays, first = _rays(codes[k])
+         piece = np.take_along_axis(rays, first[..., None], axis=3)[..., 0]
+         behind = np.take_along_axis(rays, np.minimum(first + 1, 9)[..., None], axis=3)[..., 0]
+         king = (codes[k, None, :52] == 2) & ((piece == 3) | (piece == 4)) & (behind == 0)
+         capture[k] |= king.any(axis=(1, 2))
+      res[start:start + CHUNK] = capture
+   return res
+
+def count_moves(batch):
+   # Returns (move counts, capture flags) of the positions of batch; both arrays of N.
+   # Without captures the moves are counted in bulk: men moves plus the empty squares of
+   # the king rays. Positions with a capture need the maximum capture rule: they are
+   # counted with the move generation of mad100_moves (scalar path).
+   _need_numpy()
+   captures = has_captures(batch)
+   counts = np.zeros(len(batch), dtype=np.int32)
+   for start in range(0, len(batch), CHUNK):
+      part = batch[start:start + CHUNK]
+      counts[start:start + CHUNK] = men_moves(part).sum(axis=(1, 2))
+      codes = _padded(part)
+      k = np.nonzero((codes == 2).any(axis=1))[0]    # only the positions with kings
+      if len(k) > 0:
+         rays, first = _rays(codes[k])
+         counts[start + k] += ((codes[k, None, :52] == 2) * first).sum(axis=(1, 2))
+   for n in np.nonzero(captures)[0]:
+      counts[n] = len(generate(mad100.Position(decode(batch, n), 0)))
+   return counts, captures
+
+
+# *********************************************************************************
+def main():
+   print('nothing to do')
+   return 0
+
+if __name__ == '__main__':
+    main()